@@ -1 +1,15 @@
 # agent/__init__.py
+#
+# Loads .env before any agent module is imported. Several of them read
+# AGENTFORGE_* settings at import time (agent/clients.py, agent/index.py,
+# agent/sandbox.py, ...), so loading it later - e.g. when the first client
+# is built - would be too late for those. Variables already set in the
+# real environment win over .env. python-dotenv is small; without it only
+# the real environment is used.
+
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    pass
+else:
+    load_dotenv()
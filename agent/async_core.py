@@ -0,0 +1,97 @@
+# agent/async_core.py
+# Async version of the agent loop, for serving lots of runs from one process.
+#
+# Same ReAct loop as AgentForge (it reuses all the bookkeeping), but:
+# - model calls go through the shared AsyncAnthropic client, so waiting on
+#   Claude doesn't block a thread
+# - tools run through execute_tool_async (native async where we have it,
+#   otherwise offloaded to the default executor)
+# - a run can be cancelled, either with task.cancel() or agent.cancel()
+#
+# Usage:
+#   agent = AsyncAgentForge(mode="research")
+#   result = await agent.run("...")
+
+import time
+import asyncio
+
+from agent.clients import get_async_client
+from agent.cassette import model_client
+from agent.core import AgentForge
+from agent.tools import execute_tool_async
+
+
+class AsyncAgentForge(AgentForge):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._task = None
+
+    def _make_client(self):
+        return model_client(get_async_client, is_async=True)
+
+    async def run(self, task: str, verbose: bool = False) -> dict:
+        """
+        Same as AgentForge.run, but awaitable. Cancelling the run stops
+        the current model call and any tools still in flight.
+        """
+        self._task = asyncio.current_task()
+        self._start(task, verbose)
+
+        try:
+            while self.total_steps < self.max_steps:
+                self.total_steps += 1
+
+                if verbose:
+                    print(f"-- step {self.total_steps} --")
+
+                t0 = time.perf_counter()
+                kwargs = self._request_kwargs()
+                response = await self.scheduler.call_async(
+                    lambda: self.client.messages.create(**kwargs),
+                    priority=self.priority,
+                    tokens=self._estimate_request(),
+                )
+                latency = time.perf_counter() - t0
+
+                step_info, tool_blocks, tool_actions = self._observe(response, verbose, latency)
+
+                outcomes = await self._run_tools_async(tool_blocks)
+                self._feed_results(step_info, tool_blocks, tool_actions, outcomes, verbose)
+
+                if response.stop_reason == "end_turn":
+                    return self._finish(response, verbose)
+
+            return self._step_limit_result()
+        finally:
+            self._task = None
+
+    def cancel(self) -> bool:
+        """Cancels the run in progress, if there is one."""
+        if self._task is None or self._task.done():
+            return False
+        return self._task.cancel()
+
+    async def _run_tools_async(self, tool_blocks: list) -> list:
+        """
+        Runs every tool call from one assistant turn concurrently (capped at
+        max_parallel_tools). Returns (result, seconds) pairs in block order.
+        """
+        share = self._result_share(len(tool_blocks))
+
+        async def timed(block):
+            t0 = time.perf_counter()
+            result = await execute_tool_async(block.name, block.input, share, self.file_cache)
+            return result, time.perf_counter() - t0
+
+        if not self.parallel_tools:
+            return [await timed(block) for block in tool_blocks]
+
+        limit = asyncio.Semaphore(max(1, self.max_parallel_tools))
+
+        async def run_one(block):
+            async with limit:
+                return await timed(block)
+
+        # if the run is cancelled, gather cancels every tool still in flight
+        return await asyncio.gather(*(run_one(block) for block in tool_blocks))
@@ -0,0 +1,105 @@
+# agent/cache.py
+# Small TTL + LRU cache for tool results (used by web_search).
+#
+# Two layers:
+# - in memory: an OrderedDict, least recently used entry evicted first
+# - on disk (optional): a SQLite file, so the cache survives restarts and
+#   can be shared by several processes (eval workers, the streamlit app...)
+#
+# Entries expire after ttl seconds in both layers. Point two processes at
+# the same file with a long ttl and repeated queries never leave the box,
+# which also makes eval runs reproducible offline.
+
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class TTLCache:
+
+    def __init__(self, maxsize: int = 256, ttl: float = 3600, path: str = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self._db = None
+
+        if path:
+            # one connection shared by our threads, guarded by _lock.
+            # timeout lets other processes finish their write first
+            self._db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, stored_at REAL)"
+            )
+            self._db.execute("DELETE FROM cache WHERE stored_at < ?", (time.time() - ttl,))
+            self._db.commit()
+
+    def get(self, key: str):
+        """Returns the cached value, or None if it's missing or expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._entries.pop(key, None)
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, stored_at FROM cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row and now - row[1] < self.ttl:
+                    self._remember(key, row[1], row[0])
+                    self.hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, stored_at) VALUES (?, ?, ?)",
+                    (key, value, now),
+                )
+                self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM cache")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "size": len(self._entries),
+            }
+
+    def _remember(self, key: str, stored_at: float, value: str):
+        # caller holds the lock
+        self._entries[key] = (stored_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+def normalize_query(query: str) -> str:
+    """'  Python   ASYNC ' and 'python async' should hit the same entry."""
+    return " ".join(query.lower().split())
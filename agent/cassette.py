@@ -0,0 +1,420 @@
+# agent/cassette.py
+# Record/replay for model calls and tool calls.
+#
+# A cassette is a file of (request hash -> response) entries. In "record"
+# mode every model request and tool call runs for real and gets written
+# down. In "replay" mode they're all answered from the file and nothing
+# touches the network, the sandbox or the disk - a replayed write_file
+# writes nothing, it just returns what it returned last time. So a recorded
+# eval replays in seconds, gives the same answers every time, and what's
+# left of the wall time is the agent loop itself.
+#
+# Modes:
+#   record   run everything live and start the file over
+#   replay   answer everything from the file; anything not in it raises CassetteMiss
+#   auto     replay what's in the file, run (and record) what isn't
+#
+# Keys are a sha256 of the whole request: the model params (model, system,
+# tools, messages...) or the tool name + input + result budget. So a
+# changed prompt, tool schema or earlier turn is a miss, not a stale
+# answer. The same request can come up twice with different answers
+# (read_file before and after a write_file); those replay in recorded order.
+#
+# On disk: one JSON line per entry - {"kind", "key", "name", "response"} -
+# gzipped if the path ends in .gz. Only the hash of each request is kept.
+#
+# Turn it on with
+#   AGENTFORGE_CASSETTE=path  AGENTFORGE_CASSETTE_MODE=record|replay|auto (default auto)
+# or in code:
+#   with use_cassette("eval/cassettes/smoke.jsonl.gz", "replay"):
+#       AgentForge().run(task)
+# Agents pick up the cassette when they're built (model_client), and
+# execute_tool checks for one on every call.
+
+import os
+import json
+import hashlib
+import itertools
+import threading
+from contextlib import contextmanager
+
+MODES = ("record", "replay", "auto")
+
+
+class CassetteMiss(LookupError):
+    """A request that isn't in the cassette, in replay mode."""
+
+
+class Cassette:
+
+    def __init__(self, path: str, mode: str = "auto"):
+        if mode not in MODES:
+            raise ValueError(f"unknown cassette mode {mode!r} (expected one of {', '.join(MODES)})")
+        if mode == "replay" and not os.path.exists(path):
+            raise FileNotFoundError(f"no cassette at {path}")
+        self.path = path
+        self.mode = mode
+        self._entries = {}  # key -> responses, in recorded order
+        self._played = {}   # key -> how many of them have been used
+        self._stats = {"hits": 0, "misses": 0, "recorded": 0}
+        self._lock = threading.Lock()
+        self._file = None
+
+        if mode != "record" and os.path.exists(path):
+            self._load()
+
+    def play(self, kind: str, name: str, request, live):
+        """
+        The response to request - from the cassette if it's there, otherwise
+        live() (recorded on the way back). kind is "model" or "tool".
+        """
+        key, response = self.lookup(kind, name, request)
+        if response is not None:
+            return response
+        response = live()
+        self.record(kind, key, name, response)
+        return response
+
+    def lookup(self, kind: str, name: str, request):
+        """
+        Returns (key, response). response is None when the request has
+        to go out live. Raises CassetteMiss for that in replay mode.
+        """
+        key = request_key(kind, request)
+        with self._lock:
+            recorded = self._entries.get(key, [])
+            used = self._played.get(key, 0)
+            if self.mode == "replay" and recorded:
+                # more calls than were recorded: keep answering with the last one
+                self._played[key] = used + 1
+                self._stats["hits"] += 1
+                return key, _rebuild(recorded[min(used, len(recorded) - 1)])
+            if self.mode == "auto" and used < len(recorded):
+                self._played[key] = used + 1
+                self._stats["hits"] += 1
+                return key, _rebuild(recorded[used])
+            self._stats["misses"] += 1
+        if self.mode == "replay":
+            raise CassetteMiss(f"{kind} call ({name}) isn't in {self.path} - key {key[:12]}")
+        return key, None
+
+    def record(self, kind: str, key: str, name: str, response):
+        entry = {"kind": kind, "key": key, "name": name, "response": _plain(response)}
+        line = json.dumps(entry, separators=(",", ":"), default=str) + "\n"
+        with self._lock:
+            recorded = self._entries.setdefault(key, [])
+            recorded.append(entry["response"])
+            # what we just recorded counts as used, so a repeat of this
+            # request goes out live again instead of getting this answer back
+            self._played[key] = len(recorded)
+            self._stats["recorded"] += 1
+            if self._file is None:
+                self._file = _open(self.path, "wt" if self.mode == "record" else "at")
+            self._file.write(line)
+            self._file.flush()
+
+    def client(self, factory, is_async: bool = False):
+        """A model client that goes through this cassette. factory() builds the real one, on the first miss."""
+        return CassetteClient(self, factory, is_async)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "mode": self.mode, "entries": sum(len(r) for r in self._entries.values())}
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _load(self):
+        with _open(self.path, "rt") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # a line cut short by a crash mid-write
+                self._entries.setdefault(entry["key"], []).append(entry["response"])
+
+
+class CassetteClient:
+    """
+    Stands in for an Anthropic client: messages.create, messages.stream and
+    messages.batches go through the cassette. The real client is only built
+    on a miss, so a full replay never imports the SDK or needs a key.
+    """
+
+    def __init__(self, cassette: Cassette, factory, is_async: bool = False):
+        self.cassette = cassette
+        self._factory = factory
+        self._inner = None
+        self.messages = _AsyncMessages(self) if is_async else _Messages(self)
+
+    @property
+    def inner(self):
+        if self._inner is None:
+            self._inner = self._factory()
+        return self._inner
+
+
+class _Messages:
+
+    def __init__(self, client: CassetteClient):
+        self._client = client
+        self.batches = _Batches(client)
+
+    def create(self, **params):
+        return self._client.cassette.play(
+            "model", params.get("model"), params,
+            lambda: self._client.inner.messages.create(**params),
+        )
+
+    def stream(self, **params):
+        # same key as create(), so streamed and plain runs share recordings
+        cassette = self._client.cassette
+        name = params.get("model")
+        key, message = cassette.lookup("model", name, params)
+        if message is not None:
+            return _ReplayStream(message)
+        return _RecordingStream(
+            self._client.inner.messages.stream(**params),
+            lambda final: cassette.record("model", key, name, final),
+        )
+
+
+class _AsyncMessages:
+
+    def __init__(self, client: CassetteClient):
+        self._client = client
+
+    async def create(self, **params):
+        cassette = self._client.cassette
+        name = params.get("model")
+        key, response = cassette.lookup("model", name, params)
+        if response is not None:
+            return response
+        response = await self._client.inner.messages.create(**params)
+        cassette.record("model", key, name, response)
+        return response
+
+
+class _Batches:
+    """
+    Message Batches, one request at a time: requests already in the cassette
+    are answered from it, the rest go out as a real batch and get recorded
+    as its results are read.
+    """
+
+    def __init__(self, client: CassetteClient):
+        self._client = client
+        self._pending = {}  # batch id -> what we need to finish it off
+
+    def create(self, requests: list):
+        cassette = self._client.cassette
+        replayed = []
+        live = []
+        keys = {}
+        for request in requests:
+            params = request["params"]
+            key, message = cassette.lookup("model", params.get("model"), params)
+            if message is None:
+                live.append(request)
+                keys[request["custom_id"]] = (key, params.get("model"))
+            else:
+                replayed.append(_Record(custom_id=request["custom_id"], result=_Record(type="succeeded", message=message)))
+
+        batch = self._client.inner.messages.batches.create(requests=live) if live else None
+        batch_id = batch.id if batch is not None else f"replay_{next(_batch_ids)}"
+        self._pending[batch_id] = {"replayed": replayed, "keys": keys, "live": batch is not None}
+        return batch if batch is not None else self.retrieve(batch_id)
+
+    def retrieve(self, batch_id: str):
+        pending = self._pending.get(batch_id)
+        if pending is None or pending["live"]:
+            return self._client.inner.messages.batches.retrieve(batch_id)
+        n = len(pending["replayed"])
+        return _Record(
+            id=batch_id,
+            type="message_batch",
+            processing_status="ended",
+            request_counts=_Record(processing=0, succeeded=n, errored=0, canceled=0, expired=0),
+        )
+
+    def results(self, batch_id: str):
+        pending = self._pending.pop(batch_id, None)
+        if pending is None:
+            yield from self._client.inner.messages.batches.results(batch_id)
+            return
+        yield from pending["replayed"]
+        if not pending["live"]:
+            return
+        for entry in self._client.inner.messages.batches.results(batch_id):
+            if entry.result.type == "succeeded" and entry.custom_id in pending["keys"]:
+                key, name = pending["keys"][entry.custom_id]
+                self._client.cassette.record("model", key, name, entry.result.message)
+            yield entry
+
+    def cancel(self, batch_id: str):
+        pending = self._pending.get(batch_id)
+        if pending is not None and not pending["live"]:
+            return self.retrieve(batch_id)
+        return self._client.inner.messages.batches.cancel(batch_id)
+
+
+class _RecordingStream:
+    """Wraps a live stream (manager) and records the final message once it's read."""
+
+    def __init__(self, manager, on_final):
+        self._manager = manager
+        self._stream = None
+        self._on_final = on_final
+        self._recorded = False
+
+    def __enter__(self):
+        self._stream = self._manager.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._manager.__exit__(*exc)
+
+    def __iter__(self):
+        return iter(self._stream)
+
+    def get_final_message(self):
+        message = self._stream.get_final_message()
+        if not self._recorded:
+            self._recorded = True
+            self._on_final(message)
+        return message
+
+    def close(self):
+        self._stream.close()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class _ReplayStream:
+    """A stream rebuilt from a recorded message: block starts, text, block stops."""
+
+    def __init__(self, message):
+        self._message = message
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __iter__(self):
+        for i, block in enumerate(self._message.content):
+            yield _Record(type="content_block_start", index=i, content_block=block)
+            if block.type == "text":
+                yield _Record(type="text", text=block.text, snapshot=block.text)
+            yield _Record(type="content_block_stop", index=i, content_block=block)
+        yield _Record(type="message_stop", message=self._message)
+
+    def get_final_message(self):
+        return self._message
+
+    def close(self):
+        pass
+
+
+class _Record(dict):
+    """A replayed SDK object: a dict that also answers attribute access (block.text, response.usage...)."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+def request_key(kind: str, request) -> str:
+    canonical = json.dumps(_plain(request), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{kind}\n{canonical}".encode()).hexdigest()
+
+
+def _plain(obj):
+    """SDK objects, namespaces and replayed records -> plain JSON-able data."""
+    if isinstance(obj, dict):
+        return {str(k): _plain(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_plain(v) for v in obj]
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    if hasattr(obj, "model_dump"):
+        # what the SDK itself would send back for this object
+        return _plain(obj.model_dump(mode="json", exclude_unset=True))
+    if hasattr(obj, "__dict__"):
+        return _plain(vars(obj))
+    return str(obj)
+
+
+def _rebuild(data):
+    if isinstance(data, dict):
+        return _Record({k: _rebuild(v) for k, v in data.items()})
+    if isinstance(data, list):
+        return [_rebuild(v) for v in data]
+    return data
+
+
+def _open(path: str, mode: str):
+    directory = os.path.dirname(path)
+    if directory and mode[0] in "wa":
+        os.makedirs(directory, exist_ok=True)
+    if path.endswith(".gz"):
+        import gzip
+        return gzip.open(path, mode, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+_batch_ids = itertools.count(1)
+
+_UNSET = object()
+_cassette = _UNSET
+_cassette_lock = threading.Lock()
+
+
+def get_cassette():
+    """The active cassette, or None. Set with set_cassette / use_cassette, or AGENTFORGE_CASSETTE."""
+    global _cassette
+    if _cassette is _UNSET:
+        with _cassette_lock:
+            if _cassette is _UNSET:
+                path = os.getenv("AGENTFORGE_CASSETTE")
+                _cassette = Cassette(path, os.getenv("AGENTFORGE_CASSETTE_MODE", "auto")) if path else None
+    return _cassette
+
+
+def set_cassette(cassette):
+    """Makes cassette (or None) the active one. Returns the one it replaced."""
+    global _cassette
+    with _cassette_lock:
+        previous = None if _cassette is _UNSET else _cassette
+        _cassette = cassette
+    return previous
+
+
+@contextmanager
+def use_cassette(path: str, mode: str = "auto"):
+    """Records / replays everything inside the block to / from path."""
+    cassette = Cassette(path, mode)
+    previous = set_cassette(cassette)
+    try:
+        yield cassette
+    finally:
+        set_cassette(previous)
+        cassette.close()
+
+
+def model_client(factory, is_async: bool = False):
+    """factory()'s client, or a cassette-backed stand-in for it if a cassette is active."""
+    cassette = get_cassette()
+    if cassette is None:
+        return factory()
+    return cassette.client(factory, is_async)
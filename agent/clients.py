@@ -0,0 +1,124 @@
+# agent/clients.py
+# Process-wide Anthropic clients.
+#
+# Each client owns an HTTP connection pool. Building one per AgentForge
+# meant every run opened fresh TLS connections, and importing anthropic
+# (plus dotenv) at module level made `import agent.core` slow for CLI
+# runs and short-lived workers. Now the SDK is imported the first time a
+# client is actually needed, and every agent in the process shares one
+# client (and so one warm pool). .env is loaded by agent/__init__.py.
+#
+# The pool itself is an httpx client we build, so it can be tuned:
+#   AGENTFORGE_HTTP_MAX_CONNECTIONS     open connections, total (default 20)
+#   AGENTFORGE_HTTP_MAX_KEEPALIVE       idle connections kept open (default 10)
+#   AGENTFORGE_HTTP_KEEPALIVE_EXPIRY    seconds an idle connection is kept (default 60)
+#   AGENTFORGE_HTTP2                    "auto" (default: on if h2 is installed), "1" or "0"
+#   AGENTFORGE_SDK_RETRIES              the SDK's own retries (default 0 - agent/scheduler.py
+#                                       retries model calls, and doing both multiplies them)
+#
+# Tests can swap the network out for a local transport:
+#   configure(transport=httpx.MockTransport(handler))
+# and every client built after that (shared or not) uses it.
+#
+# The sync client is thread-safe. The async one should be used from a
+# single long-lived event loop - which is what AsyncAgentForge is for.
+
+import os
+import threading
+import importlib.util
+
+HTTP = {
+    "max_connections": int(os.getenv("AGENTFORGE_HTTP_MAX_CONNECTIONS", "20")),
+    "max_keepalive": int(os.getenv("AGENTFORGE_HTTP_MAX_KEEPALIVE", "10")),
+    "keepalive_expiry": float(os.getenv("AGENTFORGE_HTTP_KEEPALIVE_EXPIRY", "60")),
+    "http2": os.getenv("AGENTFORGE_HTTP2", "auto"),
+    "max_retries": int(os.getenv("AGENTFORGE_SDK_RETRIES", "0")),
+    "transport": None,        # httpx transport for sync clients (tests)
+    "async_transport": None,  # ...and for async ones
+}
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_client():
+    """The shared Anthropic client, created on first use."""
+    return _get("sync")
+
+
+def get_async_client():
+    """The shared AsyncAnthropic client, created on first use."""
+    return _get("async")
+
+
+def configure(**settings):
+    """
+    Changes HTTP settings (any key in HTTP) and drops the shared clients so
+    the next call builds them with the new settings.
+    """
+    unknown = set(settings) - set(HTTP)
+    if unknown:
+        raise ValueError(f"unknown client settings: {', '.join(sorted(unknown))}")
+    with _lock:
+        HTTP.update(settings)
+        _clients.clear()
+
+
+def reset_clients():
+    """
+    Drops the shared clients so the next call builds new ones (e.g. after the
+    API key changes). The old ones aren't closed - a run may still be using them.
+    """
+    with _lock:
+        _clients.clear()
+
+
+def make_client(kind: str = "sync", **overrides):
+    """
+    Builds a new, unshared client ("sync" or "async") with its own pool.
+    overrides: any key in HTTP, for this client only.
+    """
+    # heavy imports live here so importing the agent stays cheap
+    import anthropic
+    import httpx
+
+    settings = {**HTTP, **overrides}
+    is_async = kind == "async"
+
+    http_kwargs = {
+        "limits": httpx.Limits(
+            max_connections=settings["max_connections"],
+            max_keepalive_connections=settings["max_keepalive"],
+            keepalive_expiry=settings["keepalive_expiry"],
+        ),
+        "http2": _want_http2(settings["http2"]),
+    }
+    transport = settings["async_transport" if is_async else "transport"]
+    if transport is not None:
+        http_kwargs["transport"] = transport
+
+    client_kwargs = {"api_key": os.getenv("ANTHROPIC_API_KEY"), "max_retries": settings["max_retries"]}
+    if is_async:
+        return anthropic.AsyncAnthropic(http_client=anthropic.DefaultAsyncHttpxClient(**http_kwargs), **client_kwargs)
+    return anthropic.Anthropic(http_client=anthropic.DefaultHttpxClient(**http_kwargs), **client_kwargs)
+
+
+def _get(kind: str):
+    client = _clients.get(kind)
+    if client is not None:
+        return client
+    with _lock:
+        if kind not in _clients:
+            _clients[kind] = make_client(kind)
+        return _clients[kind]
+
+
+def _want_http2(setting) -> bool:
+    # httpx needs the h2 package for HTTP/2 and raises without it
+    value = str(setting).strip().lower()
+    if value in ("0", "false", "no", "off"):
+        return False
+    available = importlib.util.find_spec("h2") is not None
+    if value in ("1", "true", "yes", "on") and not available:
+        raise RuntimeError("AGENTFORGE_HTTP2 is on but the h2 package isn't installed (pip install h2)")
+    return available
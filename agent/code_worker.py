@@ -0,0 +1,231 @@
+# agent/code_worker.py
+# Warm interpreter for run_code. Started by agent/sandbox.py, not imported.
+#
+# Reads one JSON job per line on stdin, runs it, writes one JSON reply per
+# line on stdout. Each job runs in a forked child, so snippets still get a
+# clean interpreter each time - they just skip python startup and whatever
+# modules were preloaded (argv[1], a JSON list of module names).
+#
+# Job:   {"path": "/tmp/x.py", "cwd": "...", "timeout": 30, "limits": {...}}
+# Reply: {"stdout": "...", "stderr": "...", "exit_code": 0, "timed_out": false,
+#         "truncated": 0, "cpu_time": 0.01, "peak_rss_mb": 9.5}
+#
+# Each child gets its own process group and rlimits (see apply_limits), and
+# the whole group is killed when the child exits or times out, so nothing it
+# spawned keeps running. Output is read from pipes as it arrives and capped.
+#
+# Deliberately standalone (stdlib only, no agent imports) so it starts fast.
+# agent/sandbox.py imports collect for one-off processes, which run
+# apply_limits from a small launcher before exec-ing the snippet.
+
+import os
+import sys
+import json
+import time
+import select
+import signal
+import importlib
+import traceback
+
+
+def preload(modules: list):
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass  # a missing optional module shouldn't take the worker down
+
+
+def apply_limits(limits: dict):
+    """
+    Sets rlimits on the current process. Called in the child before the
+    snippet runs. Missing/zero entries are left alone.
+
+      memory_mb    address space (RLIMIT_AS)
+      cpu_seconds  CPU time, SIGXCPU when it runs out (RLIMIT_CPU)
+      max_procs    processes for the whole user, not just this tree (RLIMIT_NPROC).
+                   ignored for root
+      max_file_mb  size of any file it writes (RLIMIT_FSIZE)
+    """
+    import resource
+
+    mb = 1024 * 1024
+    wanted = [
+        ("RLIMIT_AS", limits.get("memory_mb", 0) * mb),
+        ("RLIMIT_CPU", limits.get("cpu_seconds", 0)),
+        ("RLIMIT_NPROC", limits.get("max_procs", 0)),
+        ("RLIMIT_FSIZE", limits.get("max_file_mb", 0) * mb),
+    ]
+    for name, value in wanted:
+        if not value or not hasattr(resource, name):
+            continue
+        which = getattr(resource, name)
+        _, hard = resource.getrlimit(which)
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+        # CPU gets a 1s grace between SIGXCPU and SIGKILL
+        new_hard = value + 1 if name == "RLIMIT_CPU" and hard == resource.RLIM_INFINITY else value
+        try:
+            resource.setrlimit(which, (int(value), int(new_hard)))
+        except (ValueError, OSError):
+            pass  # not allowed to lower this one here - carry on with the rest
+
+
+def kill_group(pgid: int):
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def collect(pid: int, out_fd: int, err_fd: int, timeout: float, max_output: int) -> dict:
+    """
+    Waits for the child (which leads its own process group) while reading
+    its stdout/stderr pipes. Keeps at most max_output bytes of each and
+    drains the rest, so a chatty snippet can't fill memory or block on a
+    full pipe. Kills the group on timeout, and once the child exits so any
+    background processes it started go with it. Doesn't close the fds.
+    """
+    deadline = time.monotonic() + timeout
+    kept = {out_fd: bytearray(), err_fd: bytearray()}
+    dropped = 0
+    open_fds = [out_fd, err_fd]
+    status = rusage = None
+    timed_out = False
+
+    while open_fds or status is None:
+        now = time.monotonic()
+        if status is None:
+            done, st, ru = os.wait4(pid, os.WNOHANG)
+            if done:
+                status, rusage = st, ru
+                kill_group(pid)
+                deadline = min(deadline, now + 1)  # short grace to drain the pipes
+            elif now >= deadline:
+                timed_out = True
+                kill_group(pid)
+                _, status, rusage = os.wait4(pid, 0)
+                deadline = now + 1
+                continue
+        elif now >= deadline:
+            break  # something outside the group still holds the pipes
+
+        wait = max(0.0, min(0.05, deadline - now))
+        if not open_fds:
+            time.sleep(min(wait, 0.005))
+            continue
+
+        readable, _, _ = select.select(open_fds, [], [], wait)
+        for fd in readable:
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                open_fds.remove(fd)
+                continue
+            room = max(0, max_output - len(kept[fd]))
+            kept[fd] += chunk[:room]
+            dropped += max(0, len(chunk) - room)
+
+    # ru_maxrss is KB on linux, bytes on macOS
+    rss_unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "stdout": kept[out_fd].decode("utf-8", errors="replace"),
+        "stderr": kept[err_fd].decode("utf-8", errors="replace"),
+        "exit_code": os.waitstatus_to_exitcode(status),
+        "timed_out": timed_out,
+        "truncated": dropped,
+        "cpu_time": round(rusage.ru_utime + rusage.ru_stime, 3),
+        "peak_rss_mb": round(rusage.ru_maxrss / rss_unit, 1),
+    }
+
+
+def run_child(job: dict, out_fd: int, err_fd: int):
+    """Runs in the forked child. Never returns."""
+    code = 1
+    try:
+        # own process group, so the whole tree can be killed in one go
+        os.setsid()
+
+        # stdin is our job pipe and stdout our reply pipe - the snippet gets neither
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(out_fd, 1)
+        os.dup2(err_fd, 2)
+        os.closerange(3, 256)  # job/reply pipes and anything else the worker had open
+        sys.stdin = open(0, "r", closefd=False)
+        sys.stdout = open(1, "w", closefd=False)
+        sys.stderr = open(2, "w", closefd=False)
+
+        apply_limits(job.get("limits", {}))
+
+        path = job["path"]
+        os.chdir(job.get("cwd") or os.getcwd())
+        sys.argv = [path]
+        sys.path[0] = os.path.dirname(path)
+
+        with open(path, encoding="utf-8") as f:
+            source = f.read()
+
+        # same globals a script run as `python3 file.py` would see
+        namespace = {"__name__": "__main__", "__file__": path, "__builtins__": __builtins__}
+        try:
+            exec(compile(source, path, "exec"), namespace)
+            code = 0
+        except SystemExit as e:
+            if e.code is None:
+                code = 0
+            elif isinstance(e.code, int):
+                code = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                code = 1
+        except BaseException as e:
+            # drop this frame so the traceback starts at the snippet
+            traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+            code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def run_job(job: dict) -> dict:
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        run_child(job, out_w, err_w)
+
+    os.close(out_w)
+    os.close(err_w)
+    try:
+        return collect(pid, out_r, err_r, job.get("timeout", 30), job.get("limits", {}).get("max_output", 100_000))
+    finally:
+        os.close(out_r)
+        os.close(err_r)
+
+
+def main():
+    preload(json.loads(sys.argv[1]) if len(sys.argv) > 1 else [])
+
+    # reply channel is the real stdout; keep a private handle to it
+    replies = os.fdopen(os.dup(1), "w")
+    sys.stdout = sys.stderr
+
+    replies.write(json.dumps({"ready": True}) + "\n")
+    replies.flush()
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            reply = run_job(json.loads(line))
+        except Exception as e:
+            reply = {"error": str(e)}
+        replies.write(json.dumps(reply) + "\n")
+        replies.flush()
+
+
+if __name__ == "__main__":
+    main()
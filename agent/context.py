@@ -0,0 +1,134 @@
+# agent/context.py
+# Keeps the conversation history from growing without bound.
+#
+# Every tool result stays in self.messages and gets resent on every later
+# step, so a couple of big read_file results make every request after them
+# slow and expensive. After each step we:
+# 1. replace large tool results older than the last few steps with a short
+#    stub (head of the output + what produced it, so the model can re-run it)
+# 2. if the history is still over the token budget, stub out older results
+#    more aggressively, oldest first, until it fits
+#
+# Only tool_result content is touched - the model's own text and tool calls
+# stay as they are. The full results are still in the run's step log.
+# Each result is compacted at most once, so the cached prompt prefix only
+# changes when something actually goes stale.
+
+import json
+
+CHARS_PER_TOKEN = 4  # rough, but good enough for budgeting
+
+STUB_MARKER = "[compacted]"
+
+
+def estimate_tokens(messages: list) -> int:
+    """Rough token count for a message history."""
+    return _history_chars(messages) // CHARS_PER_TOKEN
+
+
+def compact_history(
+    messages: list,
+    keep_recent: int = 2,
+    stale_chars: int = 2000,
+    token_budget: int = 50_000,
+    head_chars: int = 400,
+) -> int:
+    """
+    Compacts old tool results in place. Returns how many chars were saved.
+
+    keep_recent: how many of the newest tool-result turns are left alone
+    stale_chars: older results longer than this get stubbed out
+    token_budget: if the history is still bigger than this, older results
+        get stubbed regardless of size (the newest turn is never touched)
+    """
+    calls = _tool_calls(messages)
+    turns = [m for m in messages if m["role"] == "user" and isinstance(m["content"], list)]
+    saved = 0
+
+    # 1. stale results - anything big from before the last few steps
+    stale = turns[:-keep_recent] if keep_recent else turns
+    for turn in stale:
+        for block in _results(turn):
+            if len(_text(block)) > stale_chars:
+                saved += _stub(block, calls, head_chars)
+
+    # 2. still over budget - work forwards from the oldest result
+    excess = _history_chars(messages) - token_budget * CHARS_PER_TOKEN
+    if excess > 0:
+        for turn in turns[:-1]:
+            for block in _results(turn):
+                chars = _stub(block, calls, head_chars=0)
+                saved += chars
+                excess -= chars
+                if excess <= 0:
+                    return saved
+
+    return saved
+
+
+# -- helpers --
+
+def _stub(block: dict, calls: dict, head_chars: int) -> int:
+    """Swaps a tool_result's content for a short reference. Returns chars saved."""
+    content = _text(block)
+    if content.startswith(STUB_MARKER):
+        return 0
+
+    name, tool_input = calls.get(block.get("tool_use_id"), ("tool", {}))
+    ref = json.dumps(tool_input)[:200]
+    stub = f"{STUB_MARKER} {name}({ref}) returned {len(content)} chars, removed to save context."
+    if head_chars:
+        stub += f" It started with:\n{content[:head_chars]}"
+    stub += "\nRun the tool again if you need the full output."
+
+    if len(stub) >= len(content):
+        return 0
+
+    block["content"] = stub
+    return len(content) - len(stub)
+
+
+def _tool_calls(messages: list) -> dict:
+    """tool_use_id -> (tool name, input), from the assistant turns."""
+    calls = {}
+    for msg in messages:
+        if msg["role"] != "assistant" or not isinstance(msg["content"], list):
+            continue
+        for block in msg["content"]:
+            if _field(block, "type") == "tool_use":
+                calls[_field(block, "id")] = (_field(block, "name"), _field(block, "input") or {})
+    return calls
+
+
+def _results(turn: dict) -> list:
+    return [b for b in turn["content"] if isinstance(b, dict) and b.get("type") == "tool_result"]
+
+
+def _text(block: dict) -> str:
+    content = block.get("content", "")
+    return content if isinstance(content, str) else json.dumps(content, default=str)
+
+
+def _field(block, name: str):
+    # assistant blocks are SDK objects, everything we build ourselves is a dict
+    if isinstance(block, dict):
+        return block.get(name)
+    return getattr(block, name, None)
+
+
+def _history_chars(messages: list) -> int:
+    total = 0
+    for msg in messages:
+        content = msg["content"]
+        if isinstance(content, str):
+            total += len(content)
+            continue
+        for block in content:
+            kind = _field(block, "type")
+            if kind == "text":
+                total += len(_field(block, "text") or "")
+            elif kind == "tool_use":
+                total += len(json.dumps(_field(block, "input") or {}))
+            elif kind == "tool_result":
+                total += len(_text(block))
+    return total
@@ -8,44 +8,218 @@
 # 4. If no tool requested: we're done, return the answer
 # 5. Safety cap at 10 iterations so it can't loop forever
 
-import os
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from anthropic import Anthropic
-from dotenv import load_dotenv
 
-from agent.tools import TOOL_DEFINITIONS, execute_tool
+from agent.clients import get_client
+from agent.cassette import model_client
+from agent.tools import execute_tool
+from agent.registry import REGISTRY
+# aliased: AgentForge has a compact_history flag (parameter and attribute) of its own
+from agent.context import compact_history as compact_messages, estimate_tokens, CHARS_PER_TOKEN
+from agent.scheduler import get_scheduler
+from agent.files import FILE_CACHE, FILE_CACHE_BYTES, FileCache
 from agent.prompts import SYSTEM_PROMPT, CODE_REVIEW_PROMPT, RESEARCH_PROMPT
 
-load_dotenv()
-
 PROMPTS = {
     "general": SYSTEM_PROMPT,
     "code_review": CODE_REVIEW_PROMPT,
     "research": RESEARCH_PROMPT,
 }
 
+# prompt caching breakpoint. everything up to a marked block gets cached,
+# so later steps only pay full price for what's new since the last step
+CACHE_CONTROL = {"type": "ephemeral"}
+
+USAGE_KEYS = ("input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens")
+
 
 class AgentForge:
 
-    def __init__(self, mode: str = "general"):
-        self.client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+    def __init__(
+        self,
+        mode: str = "general",
+        parallel_tools: bool = True,
+        max_parallel_tools: int = 4,
+        prompt_caching: bool = True,
+        compact_history: bool = True,
+        share_file_cache: bool = False,
+        priority: str = "default",
+        client=None,
+    ):
+        # client replaces the shared API client, e.g. agent.fake.FakeClient()
+        self.client = client if client is not None else self._make_client()
         self.model = "claude-sonnet-4-20250514"
         self.max_steps = 10
+        # tool calls from the same assistant turn run concurrently,
+        # capped at max_parallel_tools per step
+        self.parallel_tools = parallel_tools
+        self.max_parallel_tools = max_parallel_tools
+        # cache the tool list, system prompt and conversation so far between steps
+        self.prompt_caching = prompt_caching
+        # stub out big, old tool results so request size stays roughly flat
+        # (see agent/context.py). budget is in estimated tokens
+        self.compact_history = compact_history
+        self.context_budget = 50_000
+        self.keep_recent_results = 2
+        # all the tool results from one step share this many (estimated) tokens;
+        # anything cut is kept whole in agent/results.py for read_result
+        self.step_result_budget = 20_000
+        # read_file keeps a line index + contents per file version. by default
+        # each run gets its own; share_file_cache uses the process-wide one,
+        # so it stays warm across runs
+        self.share_file_cache = share_file_cache
+        self.file_cache = FILE_CACHE
+        # model calls go through the shared scheduler (rate limits + retries,
+        # see agent/scheduler.py). "interactive" jumps ahead of "batch"
+        self.scheduler = get_scheduler()
+        self.priority = priority
         self.system_prompt = PROMPTS.get(mode, SYSTEM_PROMPT)
         self.messages = []
         self.steps = []
         self.total_steps = 0
+        self.tool_call_count = 0
+        self._run_started = time.perf_counter()
+
+    def _make_client(self):
+        # shared by every agent in the process (see agent/clients.py),
+        # behind the active cassette if there is one (agent/cassette.py)
+        return model_client(get_client)
 
     def run(self, task: str, verbose: bool = True) -> dict:
         """
         Main entry point. Give it a task, it thinks and uses tools
         until it has an answer (or hits the step limit).
         """
+        self._start(task, verbose)
+
+        while self.total_steps < self.max_steps:
+            self.total_steps += 1
+
+            if verbose:
+                print(f"-- step {self.total_steps} --")
+
+            t0 = time.perf_counter()
+            kwargs = self._request_kwargs()
+            response = self.scheduler.call(
+                lambda: self.client.messages.create(**kwargs),
+                priority=self.priority,
+                tokens=self._estimate_request(),
+            )
+            latency = time.perf_counter() - t0
+
+            result = self._step(response, verbose, latency)
+            if result is not None:
+                return result
+
+        return self._step_limit_result()
+
+    def run_stream(self, task: str):
+        """
+        Streaming version of run(). Yields events as they happen instead of
+        returning once at the end, so a UI can show progress live:
+
+          {"type": "step_start", "step": n}
+          {"type": "text_delta", "step": n, "text": "..."}
+          {"type": "tool_use_start", "step": n, "id": ..., "tool": name}
+          {"type": "tool_result", "step": n, "id": ..., "tool": name, "input": {...}, "result": "..."}
+          {"type": "step_end", "step": n, "info": step_info}
+          {"type": "final", "result": {...}}   # same dict run() returns
+
+        Step info also records time to first token for streamed steps.
+
+        Tool results come out in the order the tools finish; the history
+        sent back to Claude still keeps them in tool_use order.
+        """
+        self._start(task, verbose=False)
+
+        while self.total_steps < self.max_steps:
+            self.total_steps += 1
+            step = self.total_steps
+            yield {"type": "step_start", "step": step}
+
+            t0 = time.perf_counter()
+            first_token = None
+            estimate = self._estimate_request()
+            stream = self._open_stream(self._request_kwargs(), estimate)
+            try:
+                for event in stream:
+                    if first_token is None and event.type in ("text", "content_block_start"):
+                        first_token = time.perf_counter() - t0
+                    if event.type == "text":
+                        yield {"type": "text_delta", "step": step, "text": event.text}
+                    elif event.type == "content_block_start" and event.content_block.type == "tool_use":
+                        yield {
+                            "type": "tool_use_start",
+                            "step": step,
+                            "id": event.content_block.id,
+                            "tool": event.content_block.name,
+                        }
+                response = stream.get_final_message()
+            finally:
+                stream.close()
+            self.scheduler.settle(estimate, getattr(response, "usage", None))
+            latency = time.perf_counter() - t0
+
+            step_info, tool_blocks, tool_actions = self._observe(response, False, latency)
+            step_info["first_token_latency"] = round(first_token if first_token is not None else latency, 3)
+
+            outcomes = [None] * len(tool_blocks)
+            for i, result, seconds in self._iter_tools(tool_blocks):
+                outcomes[i] = (result, seconds)
+                yield {
+                    "type": "tool_result",
+                    "step": step,
+                    "id": tool_blocks[i].id,
+                    "tool": tool_blocks[i].name,
+                    "input": tool_blocks[i].input,
+                    "result": result,
+                    "duration": round(seconds, 3),
+                }
+
+            self._feed_results(step_info, tool_blocks, tool_actions, outcomes, verbose=False)
+            yield {"type": "step_end", "step": step, "info": step_info}
+
+            if response.stop_reason == "end_turn":
+                yield {"type": "final", "result": self._finish(response, verbose=False)}
+                return
+
+        yield {"type": "final", "result": self._step_limit_result()}
+
+    # -- loop pieces, shared with AsyncAgentForge and eval/batch.py --
+
+    def _step(self, response, verbose: bool, latency: float = 0.0):
+        """
+        Handles one model response: records it, runs its tools and queues
+        the results. Returns the final result if the run is done, else None.
+        """
+        step_info, tool_blocks, tool_actions = self._observe(response, verbose, latency)
+
+        # actually run the tools
+        outcomes = self._run_tools(tool_blocks)
+        self._feed_results(step_info, tool_blocks, tool_actions, outcomes, verbose)
+
+        # if Claude stopped on its own (not waiting for tool results), we're done
+        if response.stop_reason == "end_turn":
+            return self._finish(response, verbose)
+        return None
+
+    def _step_limit_result(self) -> dict:
+        return self._result("Hit the step limit. Here's what I have so far:\n" + self._last_thought())
+
+    def _start(self, task: str, verbose: bool):
         self.messages = [{"role": "user", "content": task}]
         self.steps = []
         self.total_steps = 0
-        tool_call_count = 0
+        self.tool_call_count = 0
+        self._run_started = time.perf_counter()
+
+        self.file_cache = FILE_CACHE if self.share_file_cache else FileCache(max_bytes=FILE_CACHE_BYTES)
+
+        # what every request costs on top of the history, for the scheduler's token budget
+        self._fixed_tokens = (len(self.system_prompt) + len(json.dumps(REGISTRY.definitions()))) // CHARS_PER_TOKEN
 
         if verbose:
             print(f"\n{'='*60}")
@@ -53,106 +227,208 @@ class AgentForge:
             print(f"{'='*60}")
             print(f"Task: {task}\n")
 
-        while self.total_steps < self.max_steps:
-            self.total_steps += 1
+    def _request_kwargs(self) -> dict:
+        tool_definitions = REGISTRY.definitions()
+        if not self.prompt_caching:
+            return {
+                "model": self.model,
+                "max_tokens": 4096,
+                "system": self.system_prompt,
+                "tools": tool_definitions,
+                "messages": self.messages,
+            }
 
-            if verbose:
-                print(f"-- step {self.total_steps} --")
+        # three breakpoints: end of the tool list, end of the system prompt,
+        # and the newest message (so the history prefix is reused next step)
+        tools = tool_definitions[:-1] + [{**tool_definitions[-1], "cache_control": CACHE_CONTROL}]
+        return {
+            "model": self.model,
+            "max_tokens": 4096,
+            "system": [{"type": "text", "text": self.system_prompt, "cache_control": CACHE_CONTROL}],
+            "tools": tools,
+            "messages": _mark_last_message(self.messages),
+        }
 
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=4096,
-                system=self.system_prompt,
-                tools=TOOL_DEFINITIONS,
-                messages=self.messages,
-            )
+    def _observe(self, response, verbose: bool, latency: float = 0.0):
+        """
+        Records a model response: adds it to the history and logs its
+        thoughts. Returns the step info plus the tool calls still to run.
+        latency is how long the model call took, in seconds.
+        """
+        assistant_content = response.content
 
-            stop_reason = response.stop_reason
-            assistant_content = response.content
+        # add the full response to conversation history
+        self.messages.append({"role": "assistant", "content": assistant_content})
 
-            # add the full response to conversation history
-            self.messages.append({"role": "assistant", "content": assistant_content})
+        step_info = {
+            "step": self.total_steps,
+            "timestamp": datetime.now().isoformat(),
+            "actions": [],
+            "model_latency": round(latency, 3),
+            "usage": _usage(response),
+        }
 
-            step_info = {
-                "step": self.total_steps,
-                "timestamp": datetime.now().isoformat(),
-                "actions": [],
-            }
+        # process response blocks - could be text, tool calls, or both.
+        # tool calls are collected first so they can all be dispatched at once
+        tool_blocks = []
+        tool_actions = []
+        for block in assistant_content:
+            if block.type == "text":
+                if verbose:
+                    preview = block.text[:200] + ("..." if len(block.text) > 200 else "")
+                    print(f"  thought: {preview}")
+                step_info["actions"].append({
+                    "type": "thought",
+                    "content": block.text,
+                })
 
-            # process response blocks - could be text, tool calls, or both
-            tool_results = []
-            for block in assistant_content:
-                if block.type == "text":
-                    if verbose:
-                        preview = block.text[:200] + ("..." if len(block.text) > 200 else "")
-                        print(f"  thought: {preview}")
-                    step_info["actions"].append({
-                        "type": "thought",
-                        "content": block.text,
-                    })
-
-                elif block.type == "tool_use":
-                    tool_name = block.name
-                    tool_input = block.input
-                    tool_call_count += 1
-
-                    if verbose:
-                        print(f"  tool: {tool_name}")
-                        print(f"  input: {json.dumps(tool_input, indent=2)[:200]}")
-
-                    # actually run the tool
-                    result = execute_tool(tool_name, tool_input)
-
-                    if verbose:
-                        preview = result[:200] + ("..." if len(result) > 200 else "")
-                        print(f"  result: {preview}")
-
-                    tool_results.append({
-                        "type": "tool_result",
-                        "tool_use_id": block.id,
-                        "content": result,
-                    })
-
-                    step_info["actions"].append({
-                        "type": "tool_use",
-                        "tool": tool_name,
-                        "input": tool_input,
-                        "result": result,
-                    })
-
-            self.steps.append(step_info)
-
-            # if tools were used, feed results back and keep going
-            if tool_results:
-                self.messages.append({"role": "user", "content": tool_results})
-
-            # if Claude stopped on its own (not waiting for tool results), we're done
-            if stop_reason == "end_turn":
-                final_answer = ""
-                for block in assistant_content:
-                    if block.type == "text":
-                        final_answer += block.text
+            elif block.type == "tool_use":
+                self.tool_call_count += 1
 
                 if verbose:
-                    print(f"\n{'='*60}")
-                    print(f"Done - {self.total_steps} steps, {tool_call_count} tool calls")
-                    print(f"{'='*60}\n")
-
-                return {
-                    "result": final_answer,
-                    "steps": self.steps,
-                    "tool_calls": tool_call_count,
-                    "total_steps": self.total_steps,
+                    print(f"  tool: {block.name}")
+                    print(f"  input: {json.dumps(block.input, indent=2)[:200]}")
+
+                # placeholder keeps thoughts and tool calls in their original order
+                action = {
+                    "type": "tool_use",
+                    "tool": block.name,
+                    "input": block.input,
+                    "result": None,
+                    "duration": None,
                 }
+                step_info["actions"].append(action)
+                tool_blocks.append(block)
+                tool_actions.append(action)
+
+        return step_info, tool_blocks, tool_actions
+
+    def _feed_results(self, step_info: dict, tool_blocks: list, tool_actions: list, outcomes: list, verbose: bool):
+        """
+        Fills in tool results and queues them up for the next request.
+        outcomes are (result, seconds) pairs in tool_use order.
+        """
+        tool_results = []
+        for block, action, (result, seconds) in zip(tool_blocks, tool_actions, outcomes):
+            if verbose:
+                preview = result[:200] + ("..." if len(result) > 200 else "")
+                print(f"  result ({block.name}, {seconds:.2f}s): {preview}")
+
+            action["result"] = result
+            action["duration"] = round(seconds, 3)
+            tool_results.append({
+                "type": "tool_result",
+                "tool_use_id": block.id,
+                "content": result,
+            })
+
+        self.steps.append(step_info)
+
+        # if tools were used, feed results back and keep going
+        if tool_results:
+            self.messages.append({"role": "user", "content": tool_results})
+
+        if self.compact_history:
+            step_info["compacted_chars"] = compact_messages(
+                self.messages,
+                keep_recent=self.keep_recent_results,
+                token_budget=self.context_budget,
+            )
+
+    def _finish(self, response, verbose: bool) -> dict:
+        final_answer = ""
+        for block in response.content:
+            if block.type == "text":
+                final_answer += block.text
+
+        result = self._result(final_answer)
+
+        if verbose:
+            usage = result["usage"]
+            print(f"\n{'='*60}")
+            print(f"Done - {self.total_steps} steps, {self.tool_call_count} tool calls")
+            print(f"Time - {result['wall_time']:.1f}s total, "
+                  f"{result['model_time']:.1f}s model, {result['tool_time']:.1f}s tools")
+            print(f"Tokens - {usage['input_tokens']} in, {usage['output_tokens']} out, "
+                  f"{usage['cache_read_tokens']} cache read")
+            print(f"{'='*60}\n")
+
+        return result
+
+    def _result(self, answer: str) -> dict:
+        # run-level totals, so it's easy to see whether a run was model-bound or tool-bound
+        usage = dict.fromkeys(USAGE_KEYS, 0)
+        model_time = 0.0
+        tool_time = 0.0
+        for step in self.steps:
+            model_time += step.get("model_latency", 0.0)
+            for key in USAGE_KEYS:
+                usage[key] += step.get("usage", {}).get(key, 0)
+            for action in step["actions"]:
+                if action["type"] == "tool_use":
+                    tool_time += action.get("duration") or 0.0
 
-        # hit the step limit
         return {
-            "result": "Hit the step limit. Here's what I have so far:\n" + self._last_thought(),
+            "result": answer,
             "steps": self.steps,
-            "tool_calls": tool_call_count,
+            "tool_calls": self.tool_call_count,
             "total_steps": self.total_steps,
+            "usage": usage,
+            "model_time": round(model_time, 3),
+            # summed per tool, so parallel tools can add up to more than wall time
+            "tool_time": round(tool_time, 3),
+            "wall_time": round(time.perf_counter() - self._run_started, 3),
         }
 
+    def _run_tools(self, tool_blocks: list) -> list:
+        """
+        Runs every tool call from one assistant turn. Returns (result, seconds)
+        pairs in the same order as the blocks, so each lines up with its tool_use_id.
+        """
+        outcomes = [None] * len(tool_blocks)
+        for i, result, seconds in self._iter_tools(tool_blocks):
+            outcomes[i] = (result, seconds)
+        return outcomes
+
+    def _iter_tools(self, tool_blocks: list):
+        """
+        Dispatches the tool calls (concurrently, capped at max_parallel_tools)
+        and yields (index, result, seconds) as each one finishes.
+        """
+        share = self._result_share(len(tool_blocks))
+        if not self.parallel_tools or len(tool_blocks) < 2:
+            for i, block in enumerate(tool_blocks):
+                yield (i, *_timed_tool(block, share, self.file_cache))
+            return
+
+        workers = max(1, min(self.max_parallel_tools, len(tool_blocks)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_timed_tool, block, share, self.file_cache): i for i, block in enumerate(tool_blocks)}
+            for future in as_completed(futures):
+                yield (futures[future], *future.result())
+
+    def _estimate_request(self) -> int:
+        """Rough input tokens for the next request."""
+        return self._fixed_tokens + estimate_tokens(self.messages)
+
+    def _open_stream(self, kwargs: dict, estimate: int):
+        """
+        Opens a streamed request through the scheduler. The request goes out
+        when the stream manager is entered, so that's the part that gets
+        retried; once events are flowing the caller owns the stream.
+        """
+        return self.scheduler.call(
+            lambda: self.client.messages.stream(**kwargs).__enter__(),
+            priority=self.priority,
+            tokens=estimate,
+        )
+
+    def _result_share(self, n_calls: int):
+        """Token budget for each of n_calls results in one step. None = just the per-tool budgets."""
+        if not self.step_result_budget or not n_calls:
+            return None
+        return max(500, self.step_result_budget // n_calls)
+
     def _last_thought(self) -> str:
         """Grabs the most recent text the agent produced."""
         for msg in reversed(self.messages):
@@ -167,6 +443,50 @@ class AgentForge:
         return "No output."
 
 
+def _mark_last_message(messages: list) -> list:
+    """
+    Returns a copy of the history with a cache breakpoint on the last block
+    of the newest message. self.messages itself is left untouched.
+    """
+    if not messages:
+        return messages
+
+    last = messages[-1]
+    content = last["content"]
+    if isinstance(content, str):
+        content = [{"type": "text", "text": content}]
+    else:
+        content = list(content)
+
+    # assistant blocks are SDK objects - only tag the plain dicts we built
+    if not content or not isinstance(content[-1], dict):
+        return messages
+
+    content[-1] = {**content[-1], "cache_control": CACHE_CONTROL}
+    return messages[:-1] + [{**last, "content": content}]
+
+
+def _usage(response) -> dict:
+    """
+    Token counts for one model call. input_tokens is the uncached part of
+    the prompt; cache reads/writes are the prompt caching hits and misses.
+    """
+    usage = getattr(response, "usage", None)
+    return {
+        "input_tokens": getattr(usage, "input_tokens", None) or 0,
+        "output_tokens": getattr(usage, "output_tokens", None) or 0,
+        "cache_read_tokens": getattr(usage, "cache_read_input_tokens", None) or 0,
+        "cache_write_tokens": getattr(usage, "cache_creation_input_tokens", None) or 0,
+    }
+
+
+def _timed_tool(block, max_tokens: int = None, file_cache=None) -> tuple:
+    """Runs one tool call, returns (result, seconds it took)."""
+    t0 = time.perf_counter()
+    result = execute_tool(block.name, block.input, max_tokens, file_cache)
+    return result, time.perf_counter() - t0
+
+
 if __name__ == "__main__":
     agent = AgentForge(mode="general")
     result = agent.run("What is the current weather in London and what should I wear?")
@@ -0,0 +1,159 @@
+# agent/fake.py
+# Offline stand-in for the Anthropic client.
+#
+# Answers messages.create and the Message Batches endpoints
+# (messages.batches.create / retrieve / results / cancel) locally, from a
+# respond(params) function, so evals and tests can run the whole agent
+# loop with no network and no API key. Responses look like the SDK's:
+# .content blocks with .type/.text/.id/.name/.input, .stop_reason, .usage.
+#
+#   client = FakeClient(scripted([
+#       [tool_use("run_code", {"code": "print(1)"})],
+#       [text("done")],
+#   ]))
+#   agent = AgentForge(client=client)
+#
+# Without a respond function every request gets a one-step final answer.
+
+import time
+import json
+import itertools
+import threading
+from types import SimpleNamespace
+
+
+def text(value: str):
+    return SimpleNamespace(type="text", text=value)
+
+
+def tool_use(name: str, tool_input: dict, block_id: str = None):
+    return SimpleNamespace(type="tool_use", id=block_id or f"toolu_{next(_ids)}", name=name, input=tool_input)
+
+
+def message(content: list, stop_reason: str = None, input_tokens: int = 0, output_tokens: int = 0):
+    """A Message-shaped response. stop_reason defaults to tool_use if there are tool calls."""
+    if stop_reason is None:
+        stop_reason = "tool_use" if any(block.type == "tool_use" for block in content) else "end_turn"
+    return SimpleNamespace(
+        id=f"msg_{next(_ids)}",
+        type="message",
+        role="assistant",
+        content=content,
+        stop_reason=stop_reason,
+        usage=SimpleNamespace(
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            cache_read_input_tokens=0,
+            cache_creation_input_tokens=0,
+        ),
+    )
+
+
+def final_answer(params: dict):
+    """Default responder: answers straight away, quoting the task."""
+    task = params["messages"][0]["content"] if params.get("messages") else ""
+    return [text(f"Offline answer to: {task}")]
+
+
+def scripted(turns: list):
+    """
+    Responder that plays turns in order, per conversation: the Nth reply in
+    a conversation is turns[N] (a list of blocks), so many conversations can
+    share one script. After the last turn it keeps answering with the last one.
+    """
+    def respond(params: dict):
+        n = sum(1 for msg in params.get("messages", []) if msg["role"] == "assistant")
+        return list(turns[min(n, len(turns) - 1)])
+    return respond
+
+
+class FakeMessages:
+
+    def __init__(self, respond, latency: float):
+        self.respond = respond
+        self.latency = latency
+        self.calls = []
+        self.batches = FakeBatches(self)
+        self._lock = threading.Lock()
+
+    def create(self, **params):
+        with self._lock:
+            self.calls.append(params)
+        if self.latency:
+            time.sleep(self.latency)
+        return self.reply(params)
+
+    def reply(self, params: dict):
+        content = self.respond(params)
+        if not hasattr(content, "content"):
+            content = message(content)
+        if not content.usage.input_tokens:
+            # rough token counts so usage totals aren't all zero
+            content.usage.input_tokens = len(json.dumps(params.get("messages", []), default=str)) // 4
+            content.usage.output_tokens = sum(
+                len(getattr(block, "text", "") or json.dumps(getattr(block, "input", {}))) for block in content.content
+            ) // 4
+        return content
+
+
+class FakeBatches:
+    """
+    Message Batches, processed locally. A batch is worked out when it's
+    created and reports "ended" once batch_latency seconds have passed.
+    """
+
+    def __init__(self, messages: FakeMessages, batch_latency: float = 0.0):
+        self.messages = messages
+        self.batch_latency = batch_latency
+        self.created = []  # batch ids, in order
+        self._batches = {}
+
+    def create(self, requests: list):
+        batch_id = f"msgbatch_{next(_ids)}"
+        results = []
+        for request in requests:
+            try:
+                result = SimpleNamespace(type="succeeded", message=self.messages.reply(request["params"]))
+            except Exception as e:
+                result = SimpleNamespace(type="errored", error=SimpleNamespace(type="api_error", message=str(e)))
+            results.append(SimpleNamespace(custom_id=request["custom_id"], result=result))
+        self._batches[batch_id] = {"results": results, "ready_at": time.monotonic() + self.batch_latency, "canceled": False}
+        self.created.append(batch_id)
+        return self.retrieve(batch_id)
+
+    def retrieve(self, batch_id: str):
+        batch = self._batches[batch_id]
+        ended = batch["canceled"] or time.monotonic() >= batch["ready_at"]
+        return SimpleNamespace(
+            id=batch_id,
+            type="message_batch",
+            processing_status="ended" if ended else "in_progress",
+            request_counts=SimpleNamespace(
+                processing=0 if ended else len(batch["results"]),
+                succeeded=sum(r.result.type == "succeeded" for r in batch["results"]) if ended else 0,
+                errored=sum(r.result.type == "errored" for r in batch["results"]) if ended else 0,
+            ),
+        )
+
+    def results(self, batch_id: str):
+        batch = self._batches[batch_id]
+        if batch["canceled"]:
+            return iter([
+                SimpleNamespace(custom_id=r.custom_id, result=SimpleNamespace(type="canceled"))
+                for r in batch["results"]
+            ])
+        return iter(batch["results"])
+
+    def cancel(self, batch_id: str):
+        self._batches[batch_id]["canceled"] = True
+        return self.retrieve(batch_id)
+
+
+class FakeClient:
+
+    def __init__(self, respond=None, latency: float = 0.0, batch_latency: float = 0.0):
+        self.messages = FakeMessages(respond or final_answer, latency)
+        self.messages.batches.batch_latency = batch_latency
+
+
+_ids = itertools.count(1)
@@ -0,0 +1,482 @@
+# agent/files.py
+# Bounded, ranged reads for read_file.
+#
+# read_file used to load the whole file (and refuse anything over 1MB).
+# Now it reads a slice - by byte offset or by line range - through mmap,
+# so only the pages it actually returns get touched, however big the file.
+# The caller gets the total size and line count back too, so the model can
+# page through a big log or source file a chunk at a time.
+#
+# The agent re-reads the same files a lot (read, run, read again), so there's
+# also a FileCache: per file version (path + mtime + size) it keeps a
+# line-offset index, making line-range reads a lookup instead of a scan, and
+# for smaller files the raw bytes too. It's an LRU with a total byte budget.
+# A file whose index alone wouldn't fit the budget (8 bytes a line) isn't
+# indexed at all - only its line count is kept, and reads scan it as if
+# there were no cache.
+
+import os
+import re
+import mmap
+import shutil
+import tempfile
+import array
+import bisect
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import OrderedDict
+
+CHUNK = 1 << 20  # scan newlines a megabyte at a time
+OFFSET_BYTES = 8  # per line in the index (array "q")
+
+
+class FileCache:
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_file_bytes: int = 4 * 1024 * 1024):
+        # files bigger than max_file_bytes only get their line index cached
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # path -> entry
+        self._used = 0
+        self._too_big = OrderedDict()  # path -> (key, total lines), for files not worth indexing
+        self._lock = threading.Lock()
+
+    def get(self, path: str, st: os.stat_result) -> dict:
+        """
+        Returns {"offsets", "total_lines", "data"} for this version of the
+        file, building it if needed. offsets[0] is 0 and offsets[i] is just
+        past the i-th newline; data is the file's bytes, or None if the file
+        was too big to keep. offsets is None if the index itself would be too
+        big to keep.
+        """
+        key = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry["key"] == key:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            known = self._too_big.get(path)
+            if known and known[0] == key:
+                return _lines_only(key, known[1])
+
+        keep_data = st.st_size <= self.max_file_bytes
+        # the index is at most one offset per byte; past that cheap bound,
+        # count the lines before building an index we'd only throw away
+        if not keep_data and OFFSET_BYTES * (st.st_size + 2) > self.max_bytes:
+            total_lines = _count_file_lines(path)
+            if OFFSET_BYTES * (total_lines + 2) > self.max_bytes:
+                with self._lock:
+                    self._too_big[path] = (key, total_lines)
+                    self._too_big.move_to_end(path)
+                    while len(self._too_big) > 256:
+                        self._too_big.popitem(last=False)
+                return _lines_only(key, total_lines)
+
+        entry = _build_entry(path, key, st.st_size, keep_data=keep_data)
+
+        with self._lock:
+            self._drop(path)
+            self._too_big.pop(path, None)
+            if entry["cost"] <= self.max_bytes:
+                self._entries[path] = entry
+                self._used += entry["cost"]
+                while self._used > self.max_bytes:
+                    oldest = next(iter(self._entries))
+                    self._drop(oldest)
+        return entry
+
+    def invalidate(self, path: str):
+        with self._lock:
+            self._drop(path)
+            self._too_big.pop(path, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._too_big.clear()
+            self._used = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "files": len(self._entries),
+                "bytes": self._used,
+                "not_indexed": len(self._too_big),
+            }
+
+    def _drop(self, path: str):
+        # caller holds the lock
+        entry = self._entries.pop(path, None)
+        if entry:
+            self._used -= entry["cost"]
+
+
+# shared by read_file calls made outside a run, and by runs with
+# share_file_cache set. validated against mtime + size on each read, so it's
+# safe to keep across runs. other runs get a FileCache of their own, set
+# around each of their tool calls with use_file_cache()
+FILE_CACHE_BYTES = int(os.getenv("AGENTFORGE_FILE_CACHE_MB", "64")) * 1024 * 1024
+FILE_CACHE = FileCache(max_bytes=FILE_CACHE_BYTES)
+
+_current_cache = contextvars.ContextVar("file_cache", default=None)
+
+
+def current_file_cache() -> FileCache:
+    """The cache for the run this tool call belongs to (FILE_CACHE if none)."""
+    cache = _current_cache.get()
+    return cache if cache is not None else FILE_CACHE
+
+
+@contextmanager
+def use_file_cache(cache: FileCache):
+    """read_file calls inside the block use cache. None = leave it as it is."""
+    if cache is None:
+        yield
+        return
+    token = _current_cache.set(cache)
+    try:
+        yield
+    finally:
+        _current_cache.reset(token)
+
+
+def read_range(
+    path: str,
+    offset: int = 0,
+    start_line: int = None,
+    end_line: int = None,
+    max_bytes: int = 100_000,
+    cache: FileCache = FILE_CACHE,
+) -> dict:
+    """
+    Reads part of a file. A line range (1-based, inclusive) wins over a byte
+    offset. At most max_bytes are returned; a slice that hits the cap is cut
+    back to the last full line where possible, so the next page starts clean.
+    Pass cache=None to skip the FileCache.
+
+    Returns {"text", "size", "total_lines", "start", "end", "first_line",
+    "last_line", "truncated"} - start/end are byte offsets of the slice.
+    """
+    st = os.stat(path)
+    size = st.st_size
+    if size == 0:
+        # mmap can't map an empty file
+        return _slice_info(b"", size, 0, 0, 0, 1, False)
+
+    entry = cache.get(path, st) if cache is not None else None
+    if entry and entry["data"] is not None:
+        return _read_slice(entry["data"], entry, offset, start_line, end_line, max_bytes)
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return _read_slice(mm, entry, offset, start_line, end_line, max_bytes)
+
+
+def _read_slice(buf, entry, offset: int, start_line: int, end_line: int, max_bytes: int) -> dict:
+    """buf is the file's bytes or an mmap of it; entry is its FileCache entry, if we have one."""
+    size = len(buf)
+    offsets = entry["offsets"] if entry else None
+    total_lines = entry["total_lines"] if entry else count_lines(buf)
+    if offsets is not None:
+        find_line = lambda n: offsets[n - 1] if n - 1 < len(offsets) else size
+    else:
+        find_line = lambda n: line_offset(buf, n)
+
+    if start_line is not None or end_line is not None:
+        first = max(1, start_line or 1)
+        start = find_line(first)
+        stop = find_line(end_line + 1) if end_line is not None else size
+    else:
+        start = min(max(0, offset), size)
+        if offsets is not None:
+            first = max(1, bisect.bisect_right(offsets, start))
+        else:
+            first = _count_newlines(buf, 0, start) + 1
+        stop = size
+
+    stop = max(start, stop)
+    truncated = stop - start > max_bytes
+    if truncated:
+        stop = start + max_bytes
+        # back up to the end of the last whole line, if there is one
+        cut = buf.rfind(b"\n", start, stop)
+        if cut != -1:
+            stop = cut + 1
+
+    return _slice_info(buf[start:stop], size, total_lines, start, stop, first, truncated)
+
+
+def _build_entry(path: str, key: tuple, size: int, keep_data: bool) -> dict:
+    """Reads the file once, indexing where every line starts."""
+    offsets = array.array("q", [0])
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        # split + accumulate is a lot quicker than a find() loop in python
+        for pos in range(0, len(mm), CHUNK):
+            pieces = mm[pos:pos + CHUNK].split(b"\n")
+            ends = itertools.accumulate((len(piece) + 1 for piece in pieces[:-1]), initial=pos)
+            next(ends)  # skip the chunk start itself
+            offsets.extend(ends)
+        data = mm[:] if keep_data else None
+
+    return {
+        "key": key,
+        "offsets": offsets,
+        # a trailing newline doesn't start another line
+        "total_lines": len(offsets) - (1 if offsets[-1] == size else 0),
+        "data": data,
+        "cost": offsets.itemsize * len(offsets) + (len(data) if data is not None else 0),
+    }
+
+
+def _lines_only(key: tuple, total_lines: int) -> dict:
+    """Entry for a file we don't index: just its line count, so reads skip recounting."""
+    return {"key": key, "offsets": None, "total_lines": total_lines, "data": None, "cost": 0}
+
+
+def _count_file_lines(path: str) -> int:
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return count_lines(mm)
+
+
+def count_lines(mm) -> int:
+    """Number of lines, counting a last line with no trailing newline."""
+    size = len(mm)
+    lines = _count_newlines(mm, 0, size)
+    if size and mm[size - 1:size] != b"\n":
+        lines += 1
+    return lines
+
+
+def line_offset(mm, line_no: int) -> int:
+    """Byte offset where 1-based line line_no starts (len(mm) if past the end)."""
+    remaining = line_no - 1
+    pos = 0
+    size = len(mm)
+    while remaining > 0 and pos < size:
+        chunk = mm[pos:pos + CHUNK]
+        found = chunk.count(b"\n")
+        if found < remaining:
+            remaining -= found
+            pos += len(chunk)
+            continue
+        # the line starts inside this chunk
+        idx = -1
+        for _ in range(remaining):
+            idx = chunk.find(b"\n", idx + 1)
+        return pos + idx + 1
+    return pos if remaining == 0 else size
+
+
+def _count_newlines(mm, start: int, stop: int) -> int:
+    total = 0
+    for pos in range(start, stop, CHUNK):
+        total += mm[pos:min(pos + CHUNK, stop)].count(b"\n")
+    return total
+
+
+def _slice_info(data: bytes, size: int, total_lines: int, start: int, stop: int, first: int, truncated: bool) -> dict:
+    lines_in_slice = data.count(b"\n") + (1 if data and not data.endswith(b"\n") else 0)
+    return {
+        "text": data.decode("utf-8", errors="replace"),
+        "size": size,
+        "total_lines": total_lines,
+        "start": start,
+        "end": stop,
+        "first_line": first,
+        "last_line": first + max(lines_in_slice, 1) - 1,
+        "truncated": truncated,
+    }
+
+
+# -- writes --
+# write_file can replace a whole file, or apply search/replace edits or a
+# unified diff so the model doesn't have to re-send a whole file to change a
+# line. Every write goes to a temp file in the same directory and is renamed
+# over the target, so a crash mid-write never leaves a half-written file.
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+def atomic_write(path: str, content: str, newline: str = None):
+    """
+    Writes content to path via temp file + rename. Keeps the old file's
+    permissions; a new file gets the usual 0666 minus the umask (mkstemp
+    would leave it 0600).
+    """
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline=newline) as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+        else:
+            os.chmod(tmp_path, 0o666 & ~_umask())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+# os.umask can only be read by setting it, which would race with other
+# threads creating files - so read it once here, and from /proc when we can
+_START_UMASK = os.umask(0o022)
+os.umask(_START_UMASK)
+
+
+def _umask() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("Umask:"):
+                    return int(line.split()[1], 8)
+    except (OSError, ValueError):
+        pass
+    return _START_UMASK
+
+
+def apply_edits(text: str, edits: list) -> str:
+    """
+    Applies search/replace edits in order. Each edit is {"old", "new"} and
+    "old" has to appear exactly once (or set "replace_all": true).
+    Raises ValueError saying which edit didn't fit.
+    """
+    for n, edit in enumerate(edits, 1):
+        old = edit.get("old", "")
+        new = edit.get("new", "")
+        if not old:
+            raise ValueError(f"edit {n}: 'old' is empty")
+        count = text.count(old)
+        if count == 0:
+            raise ValueError(f"edit {n}: 'old' text not found")
+        if count > 1 and not edit.get("replace_all"):
+            raise ValueError(f"edit {n}: 'old' text matches {count} places - add more context or set replace_all")
+        text = text.replace(old, new) if edit.get("replace_all") else text.replace(old, new, 1)
+    return text
+
+
+def apply_patch(text: str, patch: str) -> str:
+    """
+    Applies a unified diff (the @@ hunks; ---/+++ headers are ignored) to
+    text. Hunks are matched on their context, starting at the line number in
+    the header and searching outwards if the file has shifted.
+    Raises ValueError if a hunk doesn't match.
+    """
+    lines = text.splitlines(keepends=True)
+    hunks = _parse_hunks(patch)
+    if not hunks:
+        raise ValueError("patch has no @@ hunks")
+
+    # diffs come with \n endings; keep a CRLF file CRLF
+    crlf = bool(lines) and lines[0].endswith("\r\n")
+
+    shift = 0  # how far earlier hunks moved later line numbers
+    for n, (start, old, new) in enumerate(hunks, 1):
+        if crlf:
+            new = [line[:-1] + "\r\n" if line.endswith("\n") and not line.endswith("\r\n") else line for line in new]
+        # a pure insertion ("@@ -25,0 +26 @@") goes *after* line start
+        base = start if not old else start - 1
+        at = _find_hunk(lines, old, max(0, base + shift))
+        if at is None:
+            raise ValueError(f"hunk {n} (@@ -{start}) doesn't match the file")
+        lines[at:at + len(old)] = new
+        shift = at - base + len(new) - len(old)
+    return "".join(lines)
+
+
+def _parse_hunks(patch: str) -> list:
+    """
+    Returns [(old_start, old_lines, new_lines)] with line endings kept.
+    A hunk runs until the next @@ or file header, not for as many lines as
+    its @@ header says - model-written diffs often get the counts wrong.
+    The counts only decide whether a "--- "/"+++ " pair is a file header:
+    inside a hunk that still has lines to come, it's a removed "-- ..."
+    line (a SQL or Lua comment, say) and an added "++ ..." one.
+    """
+    hunks = []
+    current = None
+    counts = (0, 0)  # old/new line counts from the current hunk's @@ header
+    last = []  # the side(s) the previous line went to, for "\ No newline"
+    raw_lines = patch.splitlines(keepends=True)
+    skip = False
+    for i, raw in enumerate(raw_lines):
+        if skip:
+            skip = False
+            continue
+        header = HUNK_HEADER.match(raw)
+        if header:
+            current = (int(header.group(1)), [], [])
+            counts = (int(header.group(2) or 1), int(header.group(4) or 1))
+            hunks.append(current)
+            continue
+        hunk_done = current is None or (len(current[1]) >= counts[0] and len(current[2]) >= counts[1])
+        if hunk_done and raw.startswith("--- ") and i + 1 < len(raw_lines) and raw_lines[i + 1].startswith("+++ "):
+            # ---/+++ file header pair
+            current = None
+            skip = True
+            continue
+        if current is None:
+            continue
+
+        if raw.startswith("\\"):
+            # "\ No newline at end of file" applies to the line before
+            for side in last:
+                if side and side[-1].endswith("\n"):
+                    side[-1] = side[-1].rstrip("\r\n")
+            continue
+
+        tag, body = raw[:1], raw[1:]
+        if tag not in (" ", "-", "+"):
+            if raw.strip():
+                current = None  # "diff --git", "index ..." etc - this hunk is over
+                continue
+            # some tools drop the space on blank context lines
+            tag, body = " ", raw
+        if not body.endswith("\n"):
+            body += "\n"
+
+        if tag == " ":
+            current[1].append(body)
+            current[2].append(body)
+            last = [current[1], current[2]]
+        elif tag == "-":
+            current[1].append(body)
+            last = [current[1]]
+        else:
+            current[2].append(body)
+            last = [current[2]]
+    return hunks
+
+
+def _find_hunk(lines: list, old: list, expected: int):
+    """Index where old appears in lines, closest to expected. None if nowhere."""
+    if not old:
+        return min(expected, len(lines))
+
+    def matches(at):
+        return all(_same_line(lines[at + i], old[i]) for i in range(len(old)))
+
+    last = len(lines) - len(old)
+    for distance in range(0, max(expected, last - expected) + 1):
+        for at in (expected - distance, expected + distance):
+            if 0 <= at <= last and matches(at):
+                return at
+    return None
+
+
+def _same_line(a: str, b: str) -> bool:
+    # ignore line-ending differences (CRLF files, missing final newline)
+    return a.rstrip("\r\n") == b.rstrip("\r\n")
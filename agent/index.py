@@ -0,0 +1,301 @@
+# agent/index.py
+# Trigram index for the search_files tool.
+#
+# Without it the only way to find something in a codebase is read_file one
+# file at a time (or shelling out through run_code), which eats steps fast.
+#
+# How it works:
+# 1. every text file under the root is broken into lowercase 3-char chunks
+#    (trigrams), and we keep trigram -> ids of the files that have it (a
+#    compact int array - a set of strings per file costs gigabytes on a
+#    big tree)
+# 2. a query's literal parts are broken into trigrams too; only files that
+#    contain all of them can possibly match, so only those get scanned
+# 3. the candidates are scanned line by line for the real match
+#
+# The index is built on the first search and then kept up to date lazily:
+# each search re-stats the tree and re-indexes only files whose mtime/size
+# changed (and drops deleted ones). The first search on a big tree pays for
+# the full build; after that a search is mostly the stat walk. A changed
+# file gets a new id and its old one is just forgotten, so postings collect
+# dead ids; once there are more dead ids than live files, it's rebuilt.
+#
+# Trees over AGENTFORGE_INDEX_MAX_FILES files or AGENTFORGE_INDEX_MAX_MB of
+# text aren't indexed at all - search falls back to scanning every file.
+# Only the most recently searched MAX_INDEXES roots keep their index.
+
+import os
+import re
+import array
+import fnmatch
+import threading
+from collections import OrderedDict
+
+SKIP_DIRS = {".git", ".hg", ".svn", "__pycache__", "node_modules", ".venv", "venv", ".tox", ".mypy_cache", ".pytest_cache"}
+
+MAX_FILE_BYTES = 1_000_000  # bigger files aren't searched
+MAX_INDEX_FILES = int(os.getenv("AGENTFORGE_INDEX_MAX_FILES", "20000"))
+MAX_INDEX_BYTES = int(os.getenv("AGENTFORGE_INDEX_MAX_MB", "64")) * 1024 * 1024
+MAX_INDEXES = 4
+
+META = set(".^$*+?{}[]()|\\")
+
+
+class TrigramIndex:
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.indexed = True  # False when the tree is over the caps and gets scanned instead
+        self._files = {}     # path -> (mtime_ns, size, file id)
+        self._paths = {}     # live file id -> path
+        self._postings = {}  # trigram -> array of file ids (dead ones included)
+        self._skipped = {}   # binary/unreadable path -> (mtime_ns, size), so we don't re-read them
+        self._unindexed = []  # every file, when the tree is too big to index
+        self._next_id = 0
+        self._dead = 0       # ids still in postings whose file changed or went away
+        self._lock = threading.Lock()
+
+    def refresh(self) -> int:
+        """Brings the index up to date with the tree. Returns how many files were (re)indexed."""
+        found = list(_walk(self.root))
+        changed = 0
+        with self._lock:
+            if len(found) > MAX_INDEX_FILES or sum(st.st_size for _, st in found) > MAX_INDEX_BYTES:
+                self._clear()
+                self.indexed = False
+                self._unindexed = sorted(path for path, _ in found)
+                return 0
+            if not self.indexed or self._dead > max(len(self._files), 1000):
+                self._clear()
+            self.indexed = True
+            self._unindexed = []
+
+            seen = set()
+            for path, st in found:
+                seen.add(path)
+                version = (st.st_mtime_ns, st.st_size)
+                known = self._files.get(path)
+                if (known and known[:2] == version) or self._skipped.get(path) == version:
+                    continue
+                self._remove(path)
+                trigrams = _file_trigrams(path)
+                if trigrams is None:
+                    self._skipped[path] = version
+                    continue
+                file_id = self._next_id
+                self._next_id += 1
+                self._files[path] = (st.st_mtime_ns, st.st_size, file_id)
+                self._paths[file_id] = path
+                for tri in trigrams:
+                    ids = self._postings.get(tri)
+                    if ids is None:
+                        ids = self._postings[tri] = array.array("I")
+                    ids.append(file_id)
+                changed += 1
+
+            for path in list(self._files) + list(self._skipped):
+                if path not in seen:
+                    self._remove(path)
+        return changed
+
+    def candidates(self, literals: list) -> list:
+        """Files that contain every trigram of every literal. All files if there's nothing to go on."""
+        trigrams = set()
+        for lit in literals:
+            trigrams |= _trigrams(lit.lower())
+
+        with self._lock:
+            if not self.indexed:
+                return list(self._unindexed)
+            if not trigrams:
+                return sorted(self._files)
+            result = None
+            # smallest posting list first, so the intersection shrinks fast
+            for tri in sorted(trigrams, key=lambda t: len(self._postings.get(t, ()))):
+                ids = self._postings.get(tri)
+                if not ids:
+                    return []
+                result = set(ids) if result is None else result.intersection(ids)
+                if not result:
+                    return []
+            return sorted(self._paths[i] for i in result if i in self._paths)
+
+    def search(self, pattern: str, regex: bool = False, glob: str = None, max_results: int = 50) -> tuple:
+        """
+        Returns (hits, files_matched, total_hits). hits are (path, line_no, line)
+        tuples, at most max_results of them. Matching is case-insensitive.
+        """
+        self.refresh()
+
+        if regex:
+            matcher = re.compile(pattern, re.IGNORECASE)
+            literals = required_literals(pattern)
+        else:
+            matcher = re.compile(re.escape(pattern), re.IGNORECASE)
+            literals = [pattern]
+
+        hits = []
+        files_matched = 0
+        total = 0
+        for path in self.candidates(literals):
+            rel = os.path.relpath(path, self.root)
+            if glob and not (fnmatch.fnmatch(rel, glob) or fnmatch.fnmatch(os.path.basename(rel), glob)):
+                continue
+            if not self.indexed and not _is_text(path):
+                continue
+            found = False
+            try:
+                with open(path, "r", encoding="utf-8", errors="replace") as f:
+                    for line_no, line in enumerate(f, 1):
+                        if matcher.search(line):
+                            found = True
+                            total += 1
+                            if len(hits) < max_results:
+                                hits.append((rel, line_no, line.rstrip("\n")))
+            except OSError:
+                continue
+            files_matched += found
+        return hits, files_matched, total
+
+    def _remove(self, path: str):
+        # caller holds the lock. the file's id stays in the postings, dead
+        self._skipped.pop(path, None)
+        entry = self._files.pop(path, None)
+        if entry:
+            del self._paths[entry[2]]
+            self._dead += 1
+
+    def _clear(self):
+        # caller holds the lock
+        self._files.clear()
+        self._paths.clear()
+        self._postings.clear()
+        self._skipped.clear()
+        self._dead = 0
+
+
+def required_literals(pattern: str) -> list:
+    """
+    Pulls out plain-text runs a regex match must contain. Conservative:
+    anything inside groups or classes, or a char with a quantifier, is
+    skipped, and a pattern with alternation gives nothing (it could match
+    without any of it). Checked with python -m doctest agent/index.py:
+
+    >>> required_literals(r"def \\w+_handler\\(")
+    ['def ', '_handler(']
+    >>> required_literals(r"ip = \\d{1,3}\\.\\d{1,3}")  # the {m,n} isn't text
+    ['ip = ']
+    >>> required_literals(r"abcd{100}e"), required_literals(r"xyzb{2,12}")
+    (['abc'], ['xyz'])
+    >>> required_literals(r"foo|barbaz")
+    []
+    """
+    if "|" in pattern.replace("\\|", ""):
+        return []
+
+    runs = []
+    current = ""
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        literal = None
+        if ch == "\\" and i + 1 < len(pattern):
+            nxt = pattern[i + 1]
+            if not nxt.isalnum():
+                literal = nxt  # escaped punctuation is literal; \d, \w etc aren't
+            i += 2
+        elif ch == "[":
+            # skip the whole class
+            end = pattern.find("]", i + 2)
+            i = end + 1 if end != -1 else len(pattern)
+        elif ch == "{":
+            # skip the whole {m,n} quantifier - its digits aren't in the text
+            end = pattern.find("}", i + 1)
+            i = end + 1 if end != -1 else len(pattern)
+        elif ch == "(":
+            depth += 1
+            i += 1
+        elif ch == ")":
+            depth = max(0, depth - 1)
+            i += 1
+        elif ch in META:
+            i += 1
+        else:
+            literal = ch
+            i += 1
+
+        # a quantifier after this char makes it optional/repeatable - drop it
+        optional = i < len(pattern) and pattern[i] in "*?{"
+        if literal is not None and depth == 0 and not optional:
+            current += literal
+        else:
+            if len(current) >= 3:
+                runs.append(current)
+            current = ""
+    if len(current) >= 3:
+        runs.append(current)
+    return runs
+
+
+def _trigrams(text: str) -> set:
+    # zip over shifted copies is noticeably quicker than slicing in a loop
+    return set(map("".join, zip(text, text[1:], text[2:])))
+
+
+def _file_trigrams(path: str):
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if b"\0" in data[:8192]:
+        return None
+    return _trigrams(data.decode("utf-8", errors="replace").lower())
+
+
+def _is_text(path: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return b"\0" not in f.read(8192)
+    except OSError:
+        return False
+
+
+def _walk(root: str):
+    """Yields (path, stat) for every indexable file under root."""
+    stack = [root]
+    while stack:
+        folder = stack.pop()
+        try:
+            entries = list(os.scandir(folder))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in SKIP_DIRS:
+                        stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    st = entry.stat()
+                    # size 0: empty, or a pseudo-file (/proc, /sys) - nothing to find either way
+                    if 0 < st.st_size <= MAX_FILE_BYTES:
+                        yield entry.path, st
+            except OSError:
+                continue
+
+
+# one index per root, least recently searched dropped past MAX_INDEXES
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_index(root: str) -> TrigramIndex:
+    root = os.path.abspath(root)
+    with _indexes_lock:
+        if root not in _indexes:
+            _indexes[root] = TrigramIndex(root)
+            while len(_indexes) > MAX_INDEXES:
+                _indexes.popitem(last=False)
+        _indexes.move_to_end(root)
+        return _indexes[root]
@@ -20,8 +20,10 @@ Follow this loop for every task:
 
 - web_search: look things up online. Use for facts, docs, current info.
 - read_file: read local files. Use to look at code, configs, docs.
-- write_file: create or overwrite files. Use to save reports or code.
+- search_files: grep a directory. Use to find where things are before reading files.
+- write_file: create, overwrite or edit files. To change an existing file, send edits or a patch rather than the whole file.
 - run_code: execute Python. Use to test things, do calculations, validate.
+- read_result: page through a tool result that was cut short. Cut results tell you the result_id and offset.
 
 ## Rules
 
@@ -52,6 +54,7 @@ Analyse code for:
 5. Concrete suggestions with example fixes
 
 Always:
+- On a multi-file codebase, find the relevant code with search_files
 - Read the file first with read_file
 - Search for relevant best practices
 - Try running the code if possible
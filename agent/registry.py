@@ -0,0 +1,208 @@
+# agent/registry.py
+# Tool registry. A tool is a plain function with a @tool decorator:
+#
+#     @tool(description="Look something up.", params={"query": "What to search for."})
+#     def lookup(query: str, limit: int = 5) -> str:
+#         ...
+#
+# The JSON schema the model sees is built from the signature, once, when
+# the tool is registered: annotations give the types, parameters without
+# a default are required, and params adds descriptions (a string) or
+# replaces bits of the schema (a dict, e.g. for the items of a list).
+# Calls are checked against that schema before the function runs, so a
+# bad call comes back to the model as an "Error: ..." string instead of
+# a TypeError halfway through a tool.
+#
+# Extra tools don't need edits here or in agent/tools.py. Put them in a
+# module that uses @tool and list it in AGENTFORGE_TOOL_MODULES
+# (comma-separated), or call REGISTRY.add_module(). Those modules are only
+# imported when the tool list or a tool is first needed, so anything
+# heavy they import doesn't slow down startup.
+
+import os
+import inspect
+import importlib
+import threading
+
+JSON_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean", list: "array", dict: "object"}
+
+# what each JSON type accepts. bool is an int in python, so it's kept out of the numbers
+PY_TYPES = {
+    "string": (str,),
+    "integer": (int,),
+    "number": (int, float),
+    "boolean": (bool,),
+    "array": (list,),
+    "object": (dict,),
+}
+
+
+class ToolRegistry:
+
+    def __init__(self, modules: list = ()):
+        self._tools = {}        # name -> spec dict
+        self._definitions = []  # schemas in registration order, rebuilt in place
+        self._pending = list(modules)
+        self._lock = threading.RLock()
+
+    def tool(self, name: str = None, description: str = None, params: dict = None):
+        """Decorator: registers a function as a tool. Returns the function unchanged."""
+        def register(func):
+            self.register(func, name=name, description=description, params=params)
+            return func
+        return register
+
+    def register(self, func, name: str = None, description: str = None, params: dict = None):
+        """Registers func (replacing any tool with the same name)."""
+        name = name or func.__name__
+        schema = build_schema(func, params or {})
+        spec = {
+            "name": name,
+            "func": func,
+            "async_func": None,
+            "definition": {
+                "name": name,
+                "description": description or inspect.getdoc(func) or name,
+                "input_schema": schema,
+            },
+            "required": schema.get("required", []),
+            "types": {arg: prop.get("type") for arg, prop in schema["properties"].items()},
+        }
+        with self._lock:
+            old = self._tools.get(name)
+            if old:
+                spec["async_func"] = old["async_func"]
+            self._tools[name] = spec
+            self._rebuild()
+
+    def async_impl(self, name: str):
+        """Decorator: a native async version of an already registered tool."""
+        def register(func):
+            with self._lock:
+                self._tools[name]["async_func"] = func
+            return func
+        return register
+
+    def remove(self, name: str):
+        with self._lock:
+            if self._tools.pop(name, None):
+                self._rebuild()
+
+    def add_module(self, module_name: str):
+        """Queues a module of @tool functions to be imported the first time tools are needed."""
+        with self._lock:
+            self._pending.append(module_name)
+
+    def definitions(self, load: bool = True) -> list:
+        """
+        The schemas to send to the model. The same list object every time,
+        updated in place. load=False skips importing pending modules.
+        """
+        if load:
+            self._load_pending()
+        return self._definitions
+
+    def names(self) -> list:
+        self._load_pending()
+        return list(self._tools)
+
+    def get(self, name: str):
+        self._load_pending()
+        return self._tools.get(name)
+
+    def call(self, name: str, args: dict) -> str:
+        """Validates args and runs the tool. Always returns a string."""
+        spec = self.get(name)
+        if spec is None:
+            return f"Unknown tool: {name}"
+        kwargs, error = _check(spec, args)
+        if error:
+            return error
+        try:
+            return spec["func"](**kwargs)
+        except Exception as e:
+            return f"Error: {name} failed: {str(e)}"
+
+    async def call_async(self, name: str, args: dict) -> str:
+        """Like call, but uses the tool's async version if it has one, else a worker thread."""
+        spec = self.get(name)
+        if spec is None or spec["async_func"] is None:
+            import asyncio  # only async callers pay for it
+            import contextvars
+            loop = asyncio.get_running_loop()
+            # in the caller's context, like asyncio.to_thread (the run's file cache is a context var)
+            run = contextvars.copy_context().run
+            return await loop.run_in_executor(None, run, self.call, name, args)
+        kwargs, error = _check(spec, args)
+        if error:
+            return error
+        try:
+            return await spec["async_func"](**kwargs)
+        except Exception as e:
+            return f"Error: {name} failed: {str(e)}"
+
+    def _rebuild(self):
+        # caller holds the lock. slice assignment so anyone holding the list sees the change
+        self._definitions[:] = [spec["definition"] for spec in self._tools.values()]
+
+    def _load_pending(self):
+        if not self._pending:
+            return
+        with self._lock:
+            while self._pending:
+                importlib.import_module(self._pending.pop(0))
+
+
+def build_schema(func, params: dict) -> dict:
+    """JSON schema for func's keyword arguments."""
+    properties = {}
+    required = []
+    for arg in inspect.signature(func).parameters.values():
+        if arg.kind in (arg.VAR_POSITIONAL, arg.VAR_KEYWORD):
+            continue
+        prop = {}
+        if arg.annotation in JSON_TYPES:
+            prop["type"] = JSON_TYPES[arg.annotation]
+
+        extra = params.get(arg.name)
+        if isinstance(extra, str):
+            prop["description"] = extra
+        elif extra:
+            prop.update(extra)
+
+        properties[arg.name] = prop
+        if arg.default is arg.empty:
+            required.append(arg.name)
+
+    schema = {"type": "object", "properties": properties}
+    if required:
+        schema["required"] = required
+    return schema
+
+
+def _check(spec: dict, args: dict) -> tuple:
+    """Returns (kwargs to call with, error string or None). Unknown args are dropped."""
+    args = args or {}
+    name = spec["name"]
+    missing = [arg for arg in spec["required"] if args.get(arg) is None]
+    if missing:
+        return None, f"Error: {name} needs {', '.join(missing)}."
+
+    kwargs = {}
+    for arg, expected in spec["types"].items():
+        value = args.get(arg)
+        if value is None:
+            continue
+        allowed = PY_TYPES.get(expected)
+        if allowed and (not isinstance(value, allowed) or (isinstance(value, bool) and bool not in allowed)):
+            article = "an" if expected[0] in "aeiou" else "a"
+            return None, f"Error: {name}: {arg} should be {article} {expected}, got {type(value).__name__}."
+        kwargs[arg] = value
+    return kwargs, None
+
+
+# the process-wide registry. agent/tools.py registers the built-in tools on it
+REGISTRY = ToolRegistry(
+    [m.strip() for m in os.getenv("AGENTFORGE_TOOL_MODULES", "").split(",") if m.strip()]
+)
+tool = REGISTRY.tool
@@ -0,0 +1,167 @@
+# agent/results.py
+# Keeps tool results to a size the model can use.
+#
+# A tool can return a lot: read_file up to 1MB, run_code up to its output
+# cap, search_files a page of matches per file. All of that goes into the
+# next request (and every request after it until compaction catches up),
+# so one big result makes the rest of the run slow.
+#
+# execute_tool runs every result through fit_result:
+# - each tool has a token budget (TOOL_BUDGETS), and the agent can lower it
+#   further so all the results from one step share a per-step budget
+# - anything over budget keeps its head and tail (the start of a file, the
+#   end of a traceback) and the middle is cut
+# - the full text goes into RESULT_STORE under an id, and the cut says how
+#   to get it back with the read_result tool, a page at a time
+#
+# Tools that page themselves (read_file, read_result) aren't cut: execute_tool
+# shrinks their page size argument to fit the budget first (page_args), so
+# they return a whole page with their own "continue from" footer instead of
+# a page with a hole in it.
+#
+# The store is in memory, LRU, capped by size (AGENTFORGE_RESULT_STORE_MB,
+# default 32). Ids are unique for the life of the process.
+
+import os
+import itertools
+import threading
+from collections import OrderedDict
+
+from agent.context import CHARS_PER_TOKEN
+
+# per-tool budgets, in estimated tokens
+TOOL_BUDGETS = {
+    "read_file": 8000,
+    "read_result": 8000,
+    "run_code": 4000,
+    "web_search": 3000,
+    "search_files": 3000,
+    "write_file": 1000,
+}
+DEFAULT_BUDGET = 4000
+
+# tool -> the argument that sets its page size, and that argument's default
+PAGE_ARGS = {
+    "read_file": ("max_bytes", 100_000),
+    "read_result": ("max_chars", 20_000),
+}
+PAGE_ROOM = 300  # chars left for a paged tool's header and footer
+
+HEAD_SHARE = 0.7  # of the kept chars, how many come from the start
+
+# don't bother cutting less than this - the note would be most of the saving
+MIN_CUT_CHARS = 400
+
+
+class ResultStore:
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()  # id -> text
+        self._size = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def put(self, text: str) -> str:
+        """Stores text, returns its id."""
+        with self._lock:
+            result_id = f"r{next(self._ids)}"
+            self._items[result_id] = text
+            self._size += len(text)
+            while self._size > self.max_bytes and len(self._items) > 1:
+                _, old = self._items.popitem(last=False)
+                self._size -= len(old)
+            return result_id
+
+    def get(self, result_id: str):
+        with self._lock:
+            text = self._items.get(result_id)
+            if text is not None:
+                self._items.move_to_end(result_id)
+            return text
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"results": len(self._items), "bytes": self._size}
+
+
+RESULT_STORE = ResultStore(int(os.getenv("AGENTFORGE_RESULT_STORE_MB", "32")) * 1024 * 1024)
+
+
+def budget_for(tool_name: str, max_tokens: int = None) -> int:
+    """Token budget for one result: the tool's own, or max_tokens if that's lower."""
+    budget = TOOL_BUDGETS.get(tool_name, DEFAULT_BUDGET)
+    return min(budget, max_tokens) if max_tokens else budget
+
+
+def page_args(tool_name: str, tool_input: dict, max_tokens: int = None) -> dict:
+    """tool_input with the page size of a paging tool shrunk to fit its budget. Other tools' input as is."""
+    if tool_name not in PAGE_ARGS or not isinstance(tool_input, dict):
+        return tool_input
+    name, default = PAGE_ARGS[tool_name]
+    fits = max(1, budget_for(tool_name, max_tokens) * CHARS_PER_TOKEN - PAGE_ROOM)
+    try:
+        asked = int(tool_input.get(name) or default)
+    except (TypeError, ValueError):
+        return tool_input  # let the tool's own validation complain
+    return {**tool_input, name: min(asked, fits)}
+
+
+def fit_result(tool_name: str, result: str, max_tokens: int = None, store: ResultStore = RESULT_STORE) -> str:
+    """
+    Returns result as is if it's within budget, otherwise its head and tail
+    with a note in the middle pointing at the full text in the store.
+    """
+    max_chars = budget_for(tool_name, max_tokens) * CHARS_PER_TOKEN
+    if len(result) <= max_chars + MIN_CUT_CHARS:
+        return result
+
+    keep = max(max_chars - 200, 0)  # leave room for the note
+    head_end = _line_break_before(result, int(keep * HEAD_SHARE))
+    tail_start = _line_break_after(result, len(result) - (keep - head_end))
+    if tool_name == "read_result":
+        # already a page of something stored - point back at that instead of storing it again
+        note = (f"\n[... {tail_start - head_end:,} chars cut to fit the budget - "
+                f"ask for a smaller max_chars ...]\n")
+    else:
+        result_id = store.put(result)
+        note = (f"\n[... {tail_start - head_end:,} of {len(result):,} chars cut to fit the budget. "
+                f"Full output saved as result_id=\"{result_id}\" - read it with "
+                f"read_result(result_id=\"{result_id}\", offset={head_end}) ...]\n")
+    return result[:head_end] + note + result[tail_start:]
+
+
+def read_page(result_id: str, offset: int = 0, max_chars: int = 20_000, store: ResultStore = RESULT_STORE) -> str:
+    """A page of a stored result, with where to carry on from."""
+    text = store.get(result_id)
+    if text is None:
+        return f"Error: no stored result {result_id!r} (it may have been evicted - re-run the tool)."
+    offset = max(0, offset or 0)
+    if offset >= len(text) and text:
+        return f"Error: offset {offset} is past the end of {result_id} ({len(text)} chars)."
+
+    end = min(len(text), offset + max(1, max_chars))
+    if end < len(text):
+        end = _line_break_before(text, end, floor=offset)
+    page = text[offset:end]
+    header = f"{result_id}, chars {offset}-{end} of {len(text)}:\n"
+    footer = ""
+    if end < len(text):
+        footer = f"\n[{len(text) - end:,} more chars. Continue with offset={end}]"
+    return header + page + footer
+
+
+def _line_break_before(text: str, pos: int, floor: int = 0) -> int:
+    # cut just after the last newline before pos, unless that throws away too much
+    nl = text.rfind("\n", floor, pos)
+    return nl + 1 if nl != -1 and pos - nl < 2000 else pos
+
+
+def _line_break_after(text: str, pos: int) -> int:
+    nl = text.find("\n", pos)
+    return nl + 1 if nl != -1 and nl - pos < 2000 else pos
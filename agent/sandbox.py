@@ -0,0 +1,362 @@
+# agent/sandbox.py
+# Runs run_code snippets. Two ways of doing it:
+#
+# - a pool of warm workers (agent/code_worker.py). Each worker is a python
+#   process that's already started and has the preload modules imported;
+#   it forks a fresh child per snippet, so there's no interpreter startup
+#   per call but snippets still can't see each other's state. Workers are
+#   recycled after max_jobs snippets, or straight away if they misbehave.
+# - one fresh python3 process per snippet (run_once). Used when the pool is
+#   disabled, on platforms without fork, or if a worker falls over before
+#   it gets the snippet (after that, a retry could repeat side effects, so
+#   the failure is reported instead).
+#
+# Either way (on posix) the snippet runs in its own process group under
+# rlimits, its output is capped as it's read, the group is killed on timeout,
+# and the result reports CPU time and peak memory. That stops one snippet
+# starving other agent runs on the same host.
+#
+# Config via env:
+#   AGENTFORGE_CODE_WORKERS     pool size, 0 to disable (default 2)
+#   AGENTFORGE_CODE_PRELOAD     comma-separated modules to import up front, e.g. "numpy,pandas"
+#   AGENTFORGE_CODE_MEMORY_MB   address space limit (default 1024)
+#   AGENTFORGE_CODE_CPU_SECONDS CPU time limit (default 30)
+#   AGENTFORGE_CODE_MAX_PROCS   RLIMIT_NPROC, off by default (0). This counts every
+#                               process the user owns on the host, not just the
+#                               snippet's, and doesn't apply to root - only set it
+#                               when snippets run as a dedicated user, above that
+#                               user's normal process count
+#   AGENTFORGE_CODE_FILE_MB     max size of a file the snippet writes (default 50)
+#   AGENTFORGE_CODE_MAX_OUTPUT  bytes of stdout/stderr kept, each (default 100000)
+
+import os
+import json
+import time
+import queue
+import atexit
+import select
+import subprocess
+import threading
+
+from agent.code_worker import collect, kill_group
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "code_worker.py")
+
+# run_once's child: sets the rlimits on itself, then execs the snippet. Not
+# preexec_fn - that runs python between fork and exec, which can deadlock
+# when the parent has threads (run_code runs on tool threads)
+LIMITED_LAUNCHER = (
+    "import os, sys, json; sys.path.insert(0, sys.argv[1]); "
+    "from code_worker import apply_limits; apply_limits(json.loads(sys.argv[2])); "
+    "os.execv(sys.executable, [sys.executable, sys.argv[3]])"
+)
+
+DEFAULT_TIMEOUT = 30
+
+LIMITS = {
+    "memory_mb": int(os.getenv("AGENTFORGE_CODE_MEMORY_MB", "1024")),
+    "cpu_seconds": int(os.getenv("AGENTFORGE_CODE_CPU_SECONDS", "30")),
+    "max_procs": int(os.getenv("AGENTFORGE_CODE_MAX_PROCS", "0")),
+    "max_file_mb": int(os.getenv("AGENTFORGE_CODE_FILE_MB", "50")),
+    "max_output": int(os.getenv("AGENTFORGE_CODE_MAX_OUTPUT", "100000")),
+}
+
+
+class WorkerError(Exception):
+    """
+    The worker died or stopped answering. started says whether the job had
+    already been handed to it - if so the snippet may have partly run, and
+    running it again could repeat its side effects.
+    """
+
+    def __init__(self, message: str, started: bool = False):
+        super().__init__(message)
+        self.started = started
+
+
+class CodeWorker:
+
+    def __init__(self, preload: list):
+        self.jobs = 0
+        self._ready = False
+        self.proc = subprocess.Popen(
+            ["python3", "-u", WORKER_SCRIPT, json.dumps(list(preload))],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def run(self, job: dict, timeout: float) -> dict:
+        if not self._ready:
+            # first job also waits out interpreter startup and preloads
+            self._read_reply(timeout)
+            self._ready = True
+
+        try:
+            self.proc.stdin.write((json.dumps(job) + "\n").encode())
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise WorkerError(f"worker gone: {e}")
+
+        # the worker enforces the job timeout itself; this is the backstop
+        reply = self._read_reply(timeout + 5, started=True)
+        self.jobs += 1
+        if "error" in reply:
+            raise WorkerError(reply["error"], started=True)
+        return reply
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def stop(self):
+        if self.alive():
+            self.proc.kill()
+        self.proc.wait()
+        for pipe in (self.proc.stdin, self.proc.stdout):
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+    def _read_reply(self, timeout: float, started: bool = False) -> dict:
+        ready, _, _ = select.select([self.proc.stdout], [], [], timeout)
+        if not ready:
+            raise WorkerError("worker didn't reply in time", started)
+        line = self.proc.stdout.readline()
+        if not line:
+            raise WorkerError("worker exited", started)
+        return json.loads(line)
+
+
+class CodeWorkerPool:
+
+    def __init__(self, size: int = 2, max_jobs: int = 50, preload: list = (), limits: dict = None):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.preload = list(preload)
+        self.limits = dict(LIMITS if limits is None else limits)
+        self._idle = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def start(self):
+        """Spawns the workers now rather than on the first snippet."""
+        with self._lock:
+            if self._closed:
+                raise WorkerError("pool is shut down")
+            while len(self._workers) < self.size:
+                self._spawn()
+
+    def run(self, path: str, timeout: float = DEFAULT_TIMEOUT) -> dict:
+        """
+        Runs the script at path in a warm worker. Returns the same dict as
+        run_once. Raises WorkerError if the worker failed (not the snippet);
+        its started flag says whether the snippet could have run.
+        """
+        self.start()
+        worker = self._idle.get()
+        job = {"path": path, "cwd": os.getcwd(), "timeout": timeout, "limits": self.limits}
+        try:
+            reply = worker.run(job, timeout)
+        except Exception:
+            self._replace(worker)
+            raise
+
+        if worker.jobs >= self.max_jobs:
+            self._replace(worker)
+        else:
+            self._idle.put(worker)
+        return reply
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            for worker in self._workers:
+                worker.stop()
+            self._workers = []
+
+    def _spawn(self):
+        # caller holds the lock
+        worker = CodeWorker(self.preload)
+        self._workers.append(worker)
+        self._idle.put(worker)
+
+    def _replace(self, worker: CodeWorker):
+        # the replacement starts warming up straight away, before it's needed
+        worker.stop()
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+            if not self._closed:
+                self._spawn()
+
+
+def run_once(path: str, timeout: float = DEFAULT_TIMEOUT, limits: dict = None) -> dict:
+    """
+    Runs the script at path in a brand new python3 process. Returns
+    {"stdout", "stderr", "exit_code", "timed_out", "truncated", "cpu_time", "peak_rss_mb"}
+    (the last two are None where rusage isn't available).
+    """
+    limits = LIMITS if limits is None else limits
+
+    if os.name != "posix":
+        # no rlimits, process groups or select on pipes - plain timeout only
+        try:
+            result = subprocess.run(["python3", path], capture_output=True, text=True, timeout=timeout)
+            return _reply(result.stdout, result.stderr, result.returncode, False)
+        except subprocess.TimeoutExpired as e:
+            return _reply(_decode(e.stdout), _decode(e.stderr), None, True)
+
+    proc = subprocess.Popen(
+        _limited_command(path, limits),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
+    )
+    try:
+        reply = collect(proc.pid, proc.stdout.fileno(), proc.stderr.fileno(), timeout, limits.get("max_output", 100_000))
+    except BaseException:
+        kill_group(proc.pid)
+        proc.wait()
+        raise
+    finally:
+        proc.stdout.close()
+        proc.stderr.close()
+
+    # collect() already reaped it - tell Popen so it doesn't try again
+    proc.returncode = reply["exit_code"]
+    return reply
+
+
+async def run_once_async(path: str, timeout: float = DEFAULT_TIMEOUT, limits: dict = None) -> dict:
+    """
+    Async run_once, for AsyncAgentForge. Same limits and output cap; CPU and
+    memory aren't reported because asyncio reaps the process for us.
+    Cancelling it kills the snippet's process group.
+    """
+    import asyncio  # only the async agent needs it - keeps it out of the sync import path
+
+    limits = LIMITS if limits is None else limits
+    sandboxed = os.name == "posix"
+    proc = await asyncio.create_subprocess_exec(
+        *(_limited_command(path, limits) if sandboxed else ["python3", path]),
+        stdin=subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=sandboxed,
+    )
+    cap = limits.get("max_output", 100_000)
+    readers = [
+        asyncio.ensure_future(_read_capped(proc.stdout, cap)),
+        asyncio.ensure_future(_read_capped(proc.stderr, cap)),
+    ]
+    timed_out = False
+    try:
+        # not proc.wait() - that also waits for the pipes to close, which a
+        # background process the snippet started can hold open indefinitely
+        deadline = time.monotonic() + timeout
+        while proc.returncode is None:
+            if time.monotonic() >= deadline:
+                timed_out = True
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        # timeout, cancellation, or leftover background processes - kill the lot
+        if sandboxed:
+            kill_group(proc.pid)
+        elif proc.returncode is None:
+            proc.kill()
+        await proc.wait()
+
+    # give the readers a moment to drain now the writers are gone
+    done, pending = await asyncio.wait(readers, timeout=1)
+    for task in pending:
+        task.cancel()
+    (stdout, out_dropped), (stderr, err_dropped) = [
+        task.result() if task in done else ("", 0) for task in readers
+    ]
+
+    reply = _reply(stdout, stderr, None if timed_out else proc.returncode, timed_out)
+    reply["truncated"] = out_dropped + err_dropped
+    return reply
+
+
+async def _read_capped(stream, cap: int) -> tuple:
+    """Reads a stream to EOF, keeping the first cap bytes. Returns (text, bytes dropped)."""
+    kept = bytearray()
+    dropped = 0
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            break
+        room = max(0, cap - len(kept))
+        kept += chunk[:room]
+        dropped += max(0, len(chunk) - room)
+    return kept.decode("utf-8", errors="replace"), dropped
+
+
+def run_script(path: str, timeout: float = DEFAULT_TIMEOUT) -> dict:
+    """
+    Runs a snippet file through the worker pool if there is one, else
+    run_once. Falls back to run_once if the worker failed before it got the
+    snippet; if it failed after, raises WorkerError rather than run the
+    snippet a second time.
+    """
+    pool = get_code_pool()
+    if pool is not None:
+        try:
+            return pool.run(path, timeout)
+        except WorkerError as e:
+            if e.started:
+                raise WorkerError(
+                    f"the code worker failed while running the snippet ({e}). Not retried, "
+                    f"since it may have partly run - check for side effects before running it again.",
+                    started=True,
+                ) from e
+            # never reached a worker - a one-off process below is safe
+    return run_once(path, timeout)
+
+
+def _limited_command(path: str, limits: dict) -> list:
+    return ["python3", "-c", LIMITED_LAUNCHER, os.path.dirname(WORKER_SCRIPT), json.dumps(limits), path]
+
+
+def _reply(stdout: str, stderr: str, exit_code, timed_out: bool) -> dict:
+    return {
+        "stdout": stdout,
+        "stderr": stderr,
+        "exit_code": exit_code,
+        "timed_out": timed_out,
+        "truncated": 0,
+        "cpu_time": None,
+        "peak_rss_mb": None,
+    }
+
+
+def _decode(data) -> str:
+    if data is None:
+        return ""
+    return data.decode("utf-8", errors="replace") if isinstance(data, bytes) else data
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_code_pool():
+    """The process-wide worker pool, or None if it's disabled / unsupported here."""
+    global _pool
+    if not hasattr(os, "fork"):
+        return None
+
+    with _pool_lock:
+        if _pool is None:
+            size = int(os.getenv("AGENTFORGE_CODE_WORKERS", "2"))
+            if size <= 0:
+                return None
+            preload = [m.strip() for m in os.getenv("AGENTFORGE_CODE_PRELOAD", "").split(",") if m.strip()]
+            _pool = CodeWorkerPool(size=size, preload=preload)
+            atexit.register(_pool.shutdown)
+        return _pool
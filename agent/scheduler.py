@@ -0,0 +1,303 @@
+# agent/scheduler.py
+# Shared scheduler for model calls.
+#
+# Every agent in the process sends its messages.create calls through one
+# RequestScheduler, which:
+# - keeps us under the org's rate limits with two token buckets, one for
+#   requests per minute and one for (estimated) tokens per minute, so we
+#   wait a little up front instead of burning requests on 429s
+# - serves waiting calls by priority class: "interactive" (the UI) goes
+#   before "default", which goes before "batch" (evals)
+# - retries 429 / 529 overloaded / 5xx / connection errors with jittered
+#   exponential backoff, honouring retry-after. A 429 or 529 pauses the
+#   whole scheduler, not just the caller that got it, so concurrent runs
+#   back off together instead of stampeding
+# - counts queue depth, waits, retries and rate limit hits (stats())
+#
+# Retries live here, so the shared clients are built with the SDK's own
+# retries off (see agent/clients.py).
+#
+# Config via env (0 = no limit):
+#   AGENTFORGE_RPM            requests per minute
+#   AGENTFORGE_TPM            tokens per minute (input estimate up front, settled with real usage)
+#   AGENTFORGE_MODEL_RETRIES  retries per call (default 4)
+
+import os
+import time
+import heapq
+import random
+import itertools
+import threading
+
+PRIORITIES = {"interactive": 0, "default": 1, "batch": 2}
+
+# statuses worth retrying. 529 is "overloaded"
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+# these mean the API as a whole wants us to slow down, not just this call
+COOLDOWN_STATUSES = {429, 529}
+
+
+class TokenBucket:
+    """
+    Like search.RateLimiter, but takes variable amounts and never blocks -
+    the scheduler asks how long to wait and does the waiting itself. The
+    level can go negative when a call turns out bigger than estimated.
+    """
+
+    def __init__(self, per_minute: float, burst: float = None):
+        self.rate = per_minute / 60.0
+        self.capacity = float(burst or per_minute)
+        self._level = self.capacity
+        self._updated = time.monotonic()
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount is available (0 if it is now)."""
+        self._refill()
+        amount = min(amount, self.capacity)  # a call bigger than the bucket still has to go eventually
+        if self._level >= amount:
+            return 0.0
+        return (amount - self._level) / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self._level -= amount
+
+    def refund(self, amount: float):
+        """Gives back amount (negative to charge more). Capped at capacity."""
+        self._refill()
+        self._level = min(self.capacity, self._level + amount)
+
+    def available(self) -> float:
+        self._refill()
+        return self._level
+
+    def _refill(self):
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class RequestScheduler:
+
+    def __init__(self, rpm: float = 0, tpm: float = 0, max_retries: int = 4, backoff: float = 1.0, max_backoff: float = 30.0):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._queue = []  # heap of (priority, seq, ticket)
+        self._seq = itertools.count()
+        self._cooldown_until = 0.0
+        self._cond = threading.Condition()
+        self._stats = {
+            "requests": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "failed": 0,
+            "peak_queued": 0,
+            "waited": {name: 0.0 for name in PRIORITIES},
+            "admitted": {name: 0 for name in PRIORITIES},
+        }
+
+    def call(self, fn, priority: str = "default", tokens: int = 0):
+        """
+        Runs fn() (a model call) when the rate limits allow, retrying it on
+        rate limit / overload / server errors. tokens is the estimated input
+        size; if the result has .usage the bucket is corrected to the real count.
+        """
+        for attempt in range(self.max_retries + 1):
+            self._acquire(priority, tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self._after_error(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self.settle(tokens, getattr(result, "usage", None))
+            return result
+
+    async def call_async(self, fn, priority: str = "default", tokens: int = 0):
+        """call() for async code. fn() must return a fresh awaitable each time."""
+        import asyncio
+
+        for attempt in range(self.max_retries + 1):
+            await self._acquire_async(priority, tokens)
+            try:
+                result = await fn()
+            except Exception as e:
+                delay = self._after_error(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self.settle(tokens, getattr(result, "usage", None))
+            return result
+
+    def settle(self, estimated: int, usage):
+        """Swaps a call's estimated tokens for what it really used."""
+        if self.tokens is None or usage is None:
+            return
+        actual = sum(
+            getattr(usage, key, 0) or 0
+            for key in ("input_tokens", "output_tokens", "cache_creation_input_tokens")
+        )
+        with self._cond:
+            self.tokens.refund(estimated - actual)
+
+    def stats(self) -> dict:
+        with self._cond:
+            queued = {name: 0 for name in PRIORITIES}
+            for _, _, ticket in self._queue:
+                if not ticket["cancelled"]:
+                    queued[ticket["priority"]] += 1
+            out = dict(self._stats)
+            out["waited"] = {k: round(v, 3) for k, v in self._stats["waited"].items()}
+            out["admitted"] = dict(self._stats["admitted"])
+            out["queued"] = sum(queued.values())
+            out["queued_by_priority"] = queued
+            out["avg_wait"] = {
+                name: round(self._stats["waited"][name] / n, 3) if n else 0.0
+                for name, n in self._stats["admitted"].items()
+            }
+            out["cooldown"] = round(max(0.0, self._cooldown_until - time.monotonic()), 3)
+            if self.requests:
+                out["requests_available"] = round(self.requests.available(), 1)
+            if self.tokens:
+                out["tokens_available"] = round(self.tokens.available())
+            return out
+
+    # -- admission --
+
+    def _enqueue(self, priority: str, tokens: int) -> dict:
+        # caller holds the lock
+        if priority not in PRIORITIES:
+            raise ValueError(f"unknown priority {priority!r} (expected one of {', '.join(PRIORITIES)})")
+        ticket = {"priority": priority, "tokens": tokens, "queued_at": time.monotonic(), "cancelled": False}
+        heapq.heappush(self._queue, (PRIORITIES[priority], next(self._seq), ticket))
+        self._stats["peak_queued"] = max(self._stats["peak_queued"], len(self._queue))
+        return ticket
+
+    def _admit(self, ticket: dict) -> float:
+        """
+        Caller holds the lock. If ticket is first in line and there's room,
+        takes its share of both buckets and returns 0. Otherwise returns how
+        long to wait before asking again.
+        """
+        while self._queue and self._queue[0][2]["cancelled"]:
+            heapq.heappop(self._queue)
+        if not self._queue or self._queue[0][2] is not ticket:
+            return 0.05  # someone ahead of us - they'll notify when they go
+
+        wait = self._cooldown_until - time.monotonic()
+        if self.requests:
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens and ticket["tokens"]:
+            wait = max(wait, self.tokens.wait_time(ticket["tokens"]))
+        if wait > 0:
+            return wait
+
+        heapq.heappop(self._queue)
+        if self.requests:
+            self.requests.take(1)
+        if self.tokens and ticket["tokens"]:
+            self.tokens.take(ticket["tokens"])
+        self._stats["requests"] += 1
+        self._stats["admitted"][ticket["priority"]] += 1
+        self._stats["waited"][ticket["priority"]] += time.monotonic() - ticket["queued_at"]
+        self._cond.notify_all()
+        return 0.0
+
+    def _acquire(self, priority: str, tokens: int):
+        with self._cond:
+            ticket = self._enqueue(priority, tokens)
+            try:
+                while True:
+                    wait = self._admit(ticket)
+                    if wait <= 0:
+                        return
+                    self._cond.wait(min(wait, 1.0))
+            except BaseException:
+                ticket["cancelled"] = True
+                self._cond.notify_all()
+                raise
+
+    async def _acquire_async(self, priority: str, tokens: int):
+        import asyncio
+
+        with self._cond:
+            ticket = self._enqueue(priority, tokens)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._admit(ticket)
+                if wait <= 0:
+                    return
+                # polled rather than woken, so keep it short
+                await asyncio.sleep(min(wait, 0.05))
+        except BaseException:
+            with self._cond:
+                ticket["cancelled"] = True
+                self._cond.notify_all()
+            raise
+
+    # -- retries --
+
+    def _after_error(self, error: Exception, attempt: int):
+        """Seconds to wait before retrying, or None if this error shouldn't be retried."""
+        status = getattr(error, "status_code", None)
+        connection_error = type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+        if not (status in RETRY_STATUSES or connection_error) or attempt >= self.max_retries:
+            with self._cond:
+                self._stats["failed"] += 1
+            return None
+
+        # full jitter, so callers that failed together don't retry together
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+
+        with self._cond:
+            self._stats["retries"] += 1
+            if status in COOLDOWN_STATUSES:
+                self._stats["rate_limited"] += 1
+                self._cooldown_until = max(self._cooldown_until, time.monotonic() + delay)
+        return delay
+
+
+def _retry_after(error: Exception):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return min(float(headers.get("retry-after")), 120.0)
+    except (TypeError, ValueError):
+        return None
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> RequestScheduler:
+    """The process-wide scheduler every agent shares."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler(
+                rpm=float(os.getenv("AGENTFORGE_RPM", "0")),
+                tpm=float(os.getenv("AGENTFORGE_TPM", "0")),
+                max_retries=int(os.getenv("AGENTFORGE_MODEL_RETRIES", "4")),
+            )
+        return _scheduler
+
+
+def set_scheduler(scheduler: RequestScheduler):
+    """Swaps the shared scheduler, e.g. to change limits at runtime or in tests."""
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = scheduler
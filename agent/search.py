@@ -0,0 +1,202 @@
+# agent/search.py
+# Search backends and a shared, thread-safe pool of search clients.
+#
+# web_search used to build a new DDGS() per call, paying session and
+# connection setup every time, and a burst of parallel searches would just
+# get rate limited. Instead:
+# - clients are created once and reused (their HTTP sessions stay alive)
+# - each backend has a rate limiter shared by every pool using it
+# - failed searches are retried with jittered exponential backoff, on a
+#   fresh client in case the old session is the problem
+#
+# Backends are pluggable - StubBackend returns canned results, so tests and
+# offline runs don't need the network. Pick one with AGENTFORGE_SEARCH_BACKEND.
+
+import os
+import time
+import random
+import threading
+
+
+class SearchBackend:
+    """
+    Interface for a search provider. create_client() builds whatever
+    session object the provider needs; search() runs one query with it and
+    returns a list of {"title", "href", "body"} dicts.
+    """
+
+    name = "base"
+
+    def create_client(self):
+        return None
+
+    def search(self, client, query: str, max_results: int) -> list:
+        raise NotImplementedError
+
+
+class DDGSBackend(SearchBackend):
+    """DuckDuckGo via the ddgs package. No API key needed."""
+
+    name = "ddgs"
+
+    def create_client(self):
+        # imported here so runs that never search don't pay for it
+        from ddgs import DDGS
+        return DDGS()
+
+    def search(self, client, query: str, max_results: int) -> list:
+        return list(client.text(query, max_results=max_results))
+
+
+class StubBackend(SearchBackend):
+    """
+    Offline stand-in. Returns canned results for known queries and a
+    generic placeholder for anything else.
+    """
+
+    name = "stub"
+
+    def __init__(self, results: dict = None):
+        self.results = results or {}
+        self.queries = []
+
+    def search(self, client, query: str, max_results: int) -> list:
+        self.queries.append(query)
+        if query in self.results:
+            return self.results[query][:max_results]
+        return [{
+            "title": f"Stub result for {query}",
+            "href": "https://example.com/stub",
+            "body": f"Placeholder search result for '{query}'.",
+        }][:max_results]
+
+
+class RateLimiter:
+    """Token bucket: up to `burst` calls at once, refilled at `rate` per second."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# one limiter per backend name, so separate pools still share the budget
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _limiter_for(backend: SearchBackend, rate: float, burst: int) -> RateLimiter:
+    with _limiters_lock:
+        if backend.name not in _limiters:
+            _limiters[backend.name] = RateLimiter(rate, burst)
+        return _limiters[backend.name]
+
+
+class SearchClientPool:
+    """
+    Hands out long-lived clients for one backend. Clients are created on
+    demand up to `size`; callers beyond that wait for one to come back.
+    """
+
+    def __init__(
+        self,
+        backend: SearchBackend,
+        size: int = 4,
+        rate: float = 2.0,
+        burst: int = 2,
+        retries: int = 3,
+        backoff: float = 0.5,
+    ):
+        self.backend = backend
+        self.size = size
+        self.retries = retries
+        self.backoff = backoff
+        self.limiter = _limiter_for(backend, rate, burst)
+        self._idle = []  # a stack: most recently used first, its connection is warmest
+        self._created = 0
+        # guards _idle and _created. waiters are woken when a client comes
+        # back or when one is discarded (a free slot to create a new one in)
+        self._available = threading.Condition()
+
+    def search(self, query: str, max_results: int = 5) -> list:
+        """Runs a query, retrying with backoff. Raises the last error if every attempt fails."""
+        for attempt in range(self.retries + 1):
+            client = self._checkout()
+            try:
+                self.limiter.acquire()
+                results = self.backend.search(client, query, max_results)
+            except Exception:
+                # drop the client - its session may be what's broken
+                self._discard()
+                if attempt == self.retries:
+                    raise
+                # full jitter, so parallel callers don't retry in lockstep
+                time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+            else:
+                self._checkin(client)
+                return results
+
+    def _checkout(self):
+        with self._available:
+            while not self._idle and self._created >= self.size:
+                self._available.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._created += 1
+
+        try:
+            return self.backend.create_client()
+        except Exception:
+            self._discard()
+            raise
+
+    def _checkin(self, client):
+        with self._available:
+            self._idle.append(client)
+            self._available.notify()
+
+    def _discard(self):
+        with self._available:
+            self._created -= 1
+            self._available.notify()
+
+
+BACKENDS = {
+    "ddgs": DDGSBackend,
+    "stub": StubBackend,
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_search_pool() -> SearchClientPool:
+    """The process-wide pool web_search uses. Built on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            backend = BACKENDS[os.getenv("AGENTFORGE_SEARCH_BACKEND", "ddgs")]()
+            _pool = SearchClientPool(backend)
+        return _pool
+
+
+def set_search_backend(backend: SearchBackend, **pool_kwargs) -> SearchClientPool:
+    """Swaps the backend behind web_search, e.g. a StubBackend in tests."""
+    global _pool
+    with _pool_lock:
+        _pool = SearchClientPool(backend, **pool_kwargs)
+        return _pool
@@ -1,108 +1,59 @@
 # agent/tools.py
-# Tool definitions and implementations for the agent.
-# Each tool has a JSON schema (so the LLM knows what's available)
-# and a Python function that actually does the work.
+# The built-in tools. Each one is a Python function that does the work,
+# registered with @tool so the LLM gets a JSON schema for it (built from
+# the signature - see agent/registry.py).
 
 import os
-import subprocess
+import re
+import signal
 import tempfile
-from ddgs import DDGS
 
-
-# These schemas get sent to Claude with every request.
-# The descriptions are important - they're how the model decides
-# which tool to pick for a given task. Took some iteration to get
+from agent.cache import TTLCache, normalize_query
+from agent.search import get_search_pool
+from agent.sandbox import run_script, run_once_async
+from agent.files import FILE_CACHE, current_file_cache, use_file_cache, read_range, atomic_write, apply_edits, apply_patch
+from agent.index import get_index
+from agent.results import fit_result, page_args, read_page
+from agent.registry import REGISTRY, tool
+from agent.cassette import get_cassette
+
+
+# search results are cached by backend + normalized query (so stub results
+# from an offline run never answer a real search). set AGENTFORGE_SEARCH_CACHE
+# to a file path to keep them on disk (shared between processes and runs)
+SEARCH_CACHE = TTLCache(
+    maxsize=256,
+    ttl=float(os.getenv("AGENTFORGE_SEARCH_CACHE_TTL", "86400")),
+    path=os.getenv("AGENTFORGE_SEARCH_CACHE"),
+)
+
+
+# The schemas the model sees are built from these functions' signatures
+# plus the descriptions on each @tool (see agent/registry.py), and get sent
+# with every request. The descriptions are important - they're how the model
+# decides which tool to pick for a given task. Took some iteration to get
 # these working well (too vague = wrong tool, too specific = never used).
 
-TOOL_DEFINITIONS = [
-    {
-        "name": "web_search",
-        "description": (
-            "Search the web for current information on any topic. "
-            "Use this when you need facts, documentation, recent news, "
-            "or any information you don't already know. "
-            "Returns the top search results with titles, URLs, and snippets."
-        ),
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "query": {
-                    "type": "string",
-                    "description": "The search query. Be specific for better results."
-                }
-            },
-            "required": ["query"]
-        }
-    },
-    {
-        "name": "read_file",
-        "description": (
-            "Read the contents of a file from the local filesystem. "
-            "Use this to examine code files, config files, documentation, or any text file. "
-            "Returns the full contents of the file."
-        ),
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "file_path": {
-                    "type": "string",
-                    "description": "The path to the file to read."
-                }
-            },
-            "required": ["file_path"]
-        }
-    },
-    {
-        "name": "write_file",
-        "description": (
-            "Write content to a file on the local filesystem. "
-            "Use this to create reports, save analysis results, or generate code files. "
-            "Will create the file if it doesn't exist, or overwrite if it does."
-        ),
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "file_path": {
-                    "type": "string",
-                    "description": "The path where the file should be written."
-                },
-                "content": {
-                    "type": "string",
-                    "description": "The content to write to the file."
-                }
-            },
-            "required": ["file_path", "content"]
-        }
-    },
-    {
-        "name": "run_code",
-        "description": (
-            "Execute a Python code snippet and return the output. "
-            "Use this to test code, run calculations, validate data, "
-            "or perform any computation. The code runs in an isolated environment. "
-            "Returns stdout output and any errors."
-        ),
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "code": {
-                    "type": "string",
-                    "description": "Python code to execute."
-                }
-            },
-            "required": ["code"]
-        }
-    }
-]
-
-
-# -- implementations --
-
+@tool(
+    description=(
+        "Search the web for current information on any topic. "
+        "Use this when you need facts, documentation, recent news, "
+        "or any information you don't already know. "
+        "Returns the top search results with titles, URLs, and snippets."
+    ),
+    params={"query": "The search query. Be specific for better results."},
+)
 def web_search(query: str) -> str:
     """Searches DuckDuckGo, returns top 5 results. No API key needed."""
+    pool = get_search_pool()
+    key = f"web_search:{pool.backend.name}:{normalize_query(query)}"
+    cached = SEARCH_CACHE.get(key)
+    if cached is not None:
+        return cached
+
     try:
-        ddgs = DDGS()
-        results = list(ddgs.text(query, max_results=5))
+        # pooled, rate limited client with retries - see agent/search.py
+        results = pool.search(query, max_results=5)
 
         if not results:
             return "No results found."
@@ -114,88 +65,378 @@ def web_search(query: str) -> str:
                 f"    URL: {r['href']}\n"
                 f"    {r['body']}\n"
             )
-        return "\n".join(formatted)
+        output = "\n".join(formatted)
+
+        # only real results get cached - errors and empty pages are worth retrying
+        SEARCH_CACHE.set(key, output)
+        return output
 
     except Exception as e:
         return f"Search error: {str(e)}"
 
 
-def read_file(file_path: str) -> str:
-    """Reads a local file. Caps at 1MB to avoid blowing up context."""
+@tool(
+    description=(
+        "Read the contents of a file from the local filesystem. "
+        "Use this to examine code files, config files, documentation, or any text file. "
+        "Returns up to max_bytes of the file, with a header giving its total size and "
+        "line count. For big files, page through with start_line/end_line or offset."
+    ),
+    params={
+        "file_path": "The path to the file to read.",
+        "start_line": "First line to read (1-based). Optional.",
+        "end_line": "Last line to read (inclusive). Optional.",
+        "offset": "Byte offset to start reading from, if not using lines. Optional.",
+        "max_bytes": "Most bytes to return. Defaults to as much as fits in one result (about 30000).",
+    },
+)
+def read_file(
+    file_path: str,
+    start_line: int = None,
+    end_line: int = None,
+    offset: int = 0,
+    max_bytes: int = 100_000,
+) -> str:
+    """
+    Reads a local file, or a slice of one. Never returns more than
+    max_bytes (capped at 1MB) so big files can't blow up the context -
+    the header says where the slice sits so the model can ask for the next one.
+    """
     try:
         abs_path = os.path.abspath(file_path)
 
         if not os.path.exists(abs_path):
             return f"Error: File not found: {abs_path}"
 
-        if os.path.getsize(abs_path) > 1_000_000:
-            return "Error: File too large (>1MB)."
+        if end_line is not None and end_line < (start_line or 1):
+            return f"Error: end_line {end_line} is before start_line {start_line or 1}."
 
-        with open(abs_path, "r", encoding="utf-8", errors="replace") as f:
-            content = f.read()
+        max_bytes = max(1, min(int(max_bytes or 100_000), 1_000_000))
+        part = read_range(
+            abs_path, offset=offset or 0, start_line=start_line, end_line=end_line,
+            max_bytes=max_bytes, cache=current_file_cache(),
+        )
 
-        return f"Contents of {abs_path}:\n\n{content}"
+        whole = part["start"] == 0 and part["end"] == part["size"]
+        if whole:
+            header = f"Contents of {abs_path} ({part['size']} bytes, {part['total_lines']} lines):"
+        else:
+            header = (
+                f"Contents of {abs_path} (lines {part['first_line']}-{part['last_line']} "
+                f"of {part['total_lines']}, bytes {part['start']}-{part['end']} of {part['size']}):"
+            )
+
+        if start_line and start_line > max(part["total_lines"], 1):
+            return f"Error: start_line {start_line} is past the end of {abs_path} ({part['total_lines']} lines)."
+        if start_line is None and end_line is None and offset and offset >= part["size"] > 0:
+            return f"Error: offset {offset} is past the end of {abs_path} ({part['size']} bytes)."
+
+        footer = ""
+        if part["end"] < part["size"]:
+            footer = "\n" if part["text"].endswith("\n") else "\n\n"
+            footer += (
+                f"[{part['size'] - part['end']} more bytes. Continue with "
+                f"start_line={part['last_line'] + 1} or offset={part['end']}]"
+            )
+
+        return f"{header}\n\n{part['text']}{footer}"
 
     except Exception as e:
         return f"Error reading file: {str(e)}"
 
 
-def write_file(file_path: str, content: str) -> str:
-    """Writes content to a file. Creates parent dirs if they don't exist."""
+@tool(
+    description=(
+        "Search the text files under a directory for a string or regex, like grep. "
+        "Use this to find where something is defined or used in a codebase before "
+        "reading files, instead of reading them one by one. "
+        "Returns matching lines as path:line: text. Case-insensitive."
+    ),
+    params={
+        "pattern": "Text to search for (or a Python regex if regex is true).",
+        "path": "Directory to search. Defaults to the current directory.",
+        "regex": "Treat pattern as a regular expression. Default false.",
+        "glob": "Only search files matching this glob, e.g. '*.py'. Optional.",
+    },
+)
+def search_files(pattern: str, path: str = ".", regex: bool = False, glob: str = None) -> str:
+    """grep over a directory, backed by a trigram index (see agent/index.py)."""
     try:
-        abs_path = os.path.abspath(file_path)
-        os.makedirs(os.path.dirname(abs_path), exist_ok=True)
-
-        with open(abs_path, "w", encoding="utf-8") as f:
-            f.write(content)
-
-        return f"Wrote {len(content)} chars to {abs_path}"
-
+        if not pattern:
+            return "Error: pattern is empty - give the text (or regex) to search for."
+        if regex and re.compile(pattern).search(""):
+            return f"Error: regex {pattern!r} matches an empty string, so it would match every line. Make it more specific."
+
+        root = os.path.abspath(path)
+        if not os.path.isdir(root):
+            return f"Error: Not a directory: {root}"
+
+        hits, files_matched, total = get_index(root).search(pattern, regex=regex, glob=glob, max_results=50)
+        if not hits:
+            return f"No matches for {pattern!r} in {root}"
+
+        lines = [f"{total} matches in {files_matched} files under {root}"
+                 + (f" (showing first {len(hits)})" if total > len(hits) else "") + ":"]
+        for rel, line_no, text in hits:
+            lines.append(f"{rel}:{line_no}: {text.strip()[:200]}")
+        return "\n".join(lines)
+
+    except re.error as e:
+        return f"Error: Bad regex: {str(e)}"
     except Exception as e:
-        return f"Error writing file: {str(e)}"
-
-
+        return f"Error searching files: {str(e)}"
+
+
+@tool(
+    description=(
+        "Write or edit files on the local filesystem. "
+        "Use this to create reports, save analysis results, or generate code files. "
+        "Pass content to create/overwrite a whole file. To change part of an existing "
+        "file, pass edits (search/replace) or patch (a unified diff) instead of "
+        "re-sending the whole file. Pass files to write several files in one call. "
+        "Writes are atomic, and if any change in the call doesn't apply, nothing is written."
+    ),
+    params={
+        "file_path": "The path where the file should be written.",
+        "content": "The full content to write to the file.",
+        "edits": {
+            "description": (
+                "Search/replace edits to an existing file, applied in order. "
+                "Each 'old' must match exactly once unless replace_all is true."
+            ),
+            "items": {
+                "type": "object",
+                "properties": {
+                    "old": {"type": "string", "description": "Exact text to replace, with enough context to be unique."},
+                    "new": {"type": "string", "description": "Replacement text."},
+                    "replace_all": {"type": "boolean", "description": "Replace every match. Default false."}
+                },
+                "required": ["old", "new"]
+            },
+        },
+        "patch": "A unified diff (@@ hunks) to apply to an existing file.",
+        "files": {
+            "description": (
+                "Several changes in one call. Each item takes file_path plus one of content, edits or patch. "
+                "Items for the same file apply in order, each to the result of the ones before."
+            ),
+            "items": {
+                "type": "object",
+                "properties": {
+                    "file_path": {"type": "string"},
+                    "content": {"type": "string"},
+                    "edits": {"type": "array", "items": {"type": "object"}},
+                    "patch": {"type": "string"}
+                },
+                "required": ["file_path"]
+            },
+        },
+    },
+)
+def write_file(file_path: str = None, content: str = None, edits: list = None,
+               patch: str = None, files: list = None) -> str:
+    """
+    Writes a whole file (content), edits one in place (edits / patch), or
+    does several of those at once (files). Every change is worked out in
+    memory first, so a bad edit in a batch means nothing gets written; then
+    each file is written atomically (temp file + rename), so a crash never
+    leaves a half-written file behind.
+    """
+    changes = list(files or [])
+    if file_path:
+        changes.insert(0, {"file_path": file_path, "content": content, "edits": edits, "patch": patch})
+    if not changes:
+        return "Error: write_file needs file_path (with content, edits or patch) or files."
+
+    planned = {}    # path -> new text. later entries for the same file start from it
+    summaries = {}  # path -> what was done to it
+    for change in changes:
+        path = change.get("file_path")
+        if not path:
+            return "Error: every entry in files needs a file_path."
+        abs_path = os.path.abspath(path)
+        try:
+            planned[abs_path], summary = _plan_write(abs_path, change, planned.get(abs_path))
+        except ValueError as e:
+            return f"Error in {path}: {e}. Nothing was written."
+        except Exception as e:
+            return f"Error reading {path}: {str(e)}. Nothing was written."
+        summaries.setdefault(abs_path, []).append(summary)
+
+    done = []
+    for abs_path, text in planned.items():
+        try:
+            atomic_write(abs_path, text, newline="")
+        except Exception as e:
+            written = f" Already written: {', '.join(done)}." if done else ""
+            return f"Error writing file {abs_path}: {str(e)}.{written}"
+        finally:
+            current_file_cache().invalidate(abs_path)
+            FILE_CACHE.invalidate(abs_path)
+        done += summaries[abs_path]
+
+    return "\n".join(done)
+
+
+def _plan_write(abs_path: str, change: dict, text: str = None) -> tuple:
+    """
+    Works out the new text for one change. text is the file as planned by
+    earlier entries in the batch (None = read it from disk). Returns
+    (new text, summary).
+    """
+    edits, patch, content = change.get("edits"), change.get("patch"), change.get("content")
+    given = [name for name, value in (("content", content is not None), ("edits", edits), ("patch", patch)) if value]
+    if len(given) > 1:
+        raise ValueError(f"takes one of content, edits or patch, not {' and '.join(given)}")
+    if edits or patch:
+        if text is None:
+            # newline="" keeps the file's own line endings
+            with open(abs_path, "r", encoding="utf-8", newline="") as f:
+                text = f.read()
+        if edits:
+            text = apply_edits(text, edits)
+            return text, f"Applied {len(edits)} edit{'s' if len(edits) != 1 else ''} to {abs_path}"
+        text = apply_patch(text, patch)
+        return text, f"Applied patch to {abs_path}"
+    if content is None:
+        raise ValueError("needs content, edits or patch")
+    return content, f"Wrote {len(content)} chars to {abs_path}"
+
+
+@tool(
+    description=(
+        "Execute a Python code snippet and return the output. "
+        "Use this to test code, run calculations, validate data, "
+        "or perform any computation. The code runs in an isolated environment. "
+        "Returns stdout output and any errors."
+    ),
+    params={"code": "Python code to execute."},
+)
 def run_code(code: str) -> str:
-    """Runs Python in a subprocess with a 30s timeout."""
+    """
+    Runs Python with a 30s timeout, sandboxed with resource limits - in a
+    warm worker if the pool is on (see agent/sandbox.py).
+    """
+    tmp_path = None
     try:
         with tempfile.NamedTemporaryFile(mode="w", suffix=".py", delete=False) as tmp:
             tmp.write(code)
             tmp_path = tmp.name
 
-        result = subprocess.run(
-            ["python3", tmp_path],
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        os.unlink(tmp_path)
+        return _format_run(run_script(tmp_path, timeout=30))
 
-        output = ""
-        if result.stdout:
-            output += f"Output:\n{result.stdout}"
-        if result.stderr:
-            output += f"\nErrors:\n{result.stderr}"
+    except Exception as e:
+        return f"Error: {str(e)}"
+    finally:
+        if tmp_path:
+            os.unlink(tmp_path)
+
+
+@REGISTRY.async_impl("run_code")
+async def run_code_async(code: str) -> str:
+    """
+    Async version of run_code. Same timeout and limits, but doesn't tie up a
+    thread while the snippet runs, and kills it if the run is cancelled.
+    """
+    tmp_path = None
+    try:
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".py", delete=False) as tmp:
+            tmp.write(code)
+            tmp_path = tmp.name
 
-        return output if output.strip() else "Code ran successfully (no output)."
+        return _format_run(await run_once_async(tmp_path, timeout=30))
 
-    except subprocess.TimeoutExpired:
-        os.unlink(tmp_path)
-        return "Error: Timed out after 30s."
     except Exception as e:
         return f"Error: {str(e)}"
+    finally:
+        if tmp_path:
+            os.unlink(tmp_path)
+
+
+def _format_run(result: dict) -> str:
+    """Turns a sandbox result into the text the model sees."""
+    if result["timed_out"]:
+        output = "Error: Timed out after 30s."
+    else:
+        output = ""
+        if result["stdout"]:
+            output += f"Output:\n{result['stdout']}"
+        if result["stderr"]:
+            output += f"\nErrors:\n{result['stderr']}"
+        if not output.strip():
+            output = "Code ran successfully (no output)."
+    output = output.rstrip("\n")
+
+    if result.get("truncated"):
+        output += f"\n[output truncated - {result['truncated']} more bytes not shown]"
+
+    exit_code = result.get("exit_code")
+    if exit_code is not None and exit_code == -getattr(signal, "SIGXCPU", 0):
+        output += "\nError: Hit the CPU time limit."
+    elif exit_code is not None and exit_code == -getattr(signal, "SIGXFSZ", 0):
+        output += "\nError: Hit the file size limit."
+
+    if result.get("cpu_time") is not None:
+        output += f"\n[exit {exit_code}, cpu {result['cpu_time']:.2f}s, peak memory {result['peak_rss_mb']:.1f} MB]"
+
+    return output
+
+
+@tool(
+    description=(
+        "Read more of a tool result that was cut short to fit the context budget. "
+        "Cut results say which result_id and offset to use. Returns one page at a time."
+    ),
+    params={
+        "result_id": "The result_id from the cut result, e.g. \"r3\".",
+        "offset": "Char offset to start reading from. Default 0.",
+        "max_chars": "Most chars to return (default 20000, less if that won't fit in one result).",
+    },
+)
+def read_result(result_id: str, offset: int = 0, max_chars: int = 20_000) -> str:
+    """Pages through a full tool result that was cut down to fit the budget."""
+    max_chars = min(max(1, max_chars or 20_000), 32_000)
+    return read_page(result_id, offset, max_chars)
+
+
+# schemas for every registered tool, in registration order. a live list:
+# tools registered later (AGENTFORGE_TOOL_MODULES, REGISTRY.register) show up in it
+TOOL_DEFINITIONS = REGISTRY.definitions(load=False)
+
+
+def execute_tool(tool_name: str, tool_input: dict, max_tokens: int = None, file_cache=None) -> str:
+    """
+    Runs a tool call from the LLM through the registry, then fits the
+    result to the tool's token budget (or max_tokens, if that's lower).
+    With a cassette active the call is recorded / replayed (agent/cassette.py).
+    file_cache is the calling run's FileCache, for read_file.
+    """
+    cassette = get_cassette()
+    # paging tools get a page size that fits, so fit_result has nothing to cut
+    args = page_args(tool_name, tool_input, max_tokens)
+    with use_file_cache(file_cache):
+        if cassette is None:
+            return fit_result(tool_name, REGISTRY.call(tool_name, args), max_tokens)
+        return cassette.play(
+            "tool", tool_name, _tool_request(tool_name, tool_input, max_tokens),
+            lambda: fit_result(tool_name, REGISTRY.call(tool_name, args), max_tokens),
+        )
 
 
-# maps tool name -> function call
-def execute_tool(tool_name: str, tool_input: dict) -> str:
-    """Routes a tool call from the LLM to the right function."""
-    router = {
-        "web_search": lambda args: web_search(args["query"]),
-        "read_file": lambda args: read_file(args["file_path"]),
-        "write_file": lambda args: write_file(args["file_path"], args["content"]),
-        "run_code": lambda args: run_code(args["code"]),
-    }
+async def execute_tool_async(tool_name: str, tool_input: dict, max_tokens: int = None, file_cache=None) -> str:
+    """Async version of execute_tool, for AsyncAgentForge."""
+    cassette = get_cassette()
+    args = page_args(tool_name, tool_input, max_tokens)
+    with use_file_cache(file_cache):
+        if cassette is None:
+            return fit_result(tool_name, await REGISTRY.call_async(tool_name, args), max_tokens)
+        key, result = cassette.lookup("tool", tool_name, _tool_request(tool_name, tool_input, max_tokens))
+        if result is None:
+            result = fit_result(tool_name, await REGISTRY.call_async(tool_name, args), max_tokens)
+            cassette.record("tool", key, tool_name, result)
+        return result
 
-    if tool_name not in router:
-        return f"Unknown tool: {tool_name}"
 
-    return router[tool_name](tool_input)
+def _tool_request(tool_name: str, tool_input: dict, max_tokens: int = None) -> dict:
+    # what a tool call's cassette key is made of - the budget changes the result too
+    return {"name": tool_name, "input": tool_input, "max_tokens": max_tokens}
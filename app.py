@@ -226,19 +226,78 @@ task = st.text_area(
 )
 
 
+# -- step cards --
+def thought_card(step: int, text: str) -> str:
+    txt = text[:400]
+    if len(text) > 400:
+        txt += "..."
+    return (
+        f'<div class="s-card">'
+        f'<div class="s-label">step {step} — thought</div>'
+        f'<div class="s-thought">{txt}</div>'
+        f'</div>'
+    )
+
+
+def tool_card(step: int, tool: str) -> str:
+    return (
+        f'<div class="s-card">'
+        f'<div class="s-label">step {step} — tool</div>'
+        f'<div class="s-tool">{tool}</div>'
+        f'</div>'
+    )
+
+
 # -- run --
 if st.button("run", type="primary", use_container_width=True):
     if not task.strip():
         st.warning("type something first")
     else:
-        agent = AgentForge(mode=mode)
+        # one agent per session and mode, reused across reruns. the API client
+        # behind it is shared by the whole process (agent/clients.py)
+        key = f"agent_{mode}"
+        if key not in st.session_state:
+            st.session_state[key] = AgentForge(mode=mode, priority="interactive")
+        agent = st.session_state[key]
         status = st.status("working...", expanded=True)
         sc = status.container()
 
-        with st.spinner(""):
-            t0 = time.time()
-            result = agent.run(task, verbose=False)
-            dt = time.time() - t0
+        # cards render as events stream in, rather than all at the end
+        t0 = time.time()
+        result = None
+        thought = None
+        thought_text = ""
+
+        for event in agent.run_stream(task):
+            kind = event["type"]
+
+            if kind == "step_start":
+                status.update(label=f"working... step {event['step']}")
+                thought = None
+
+            elif kind == "text_delta":
+                if thought is None:
+                    with sc:
+                        thought = st.empty()
+                    thought_text = ""
+                thought_text += event["text"]
+                thought.markdown(thought_card(event["step"], thought_text), unsafe_allow_html=True)
+
+            elif kind == "tool_use_start":
+                # any text after this tool call starts a new card
+                thought = None
+
+            elif kind == "tool_result":
+                with sc:
+                    st.markdown(tool_card(event["step"], event["tool"]), unsafe_allow_html=True)
+                    with st.expander(f"{event['tool']} details"):
+                        st.json(event["input"])
+                        st.code(event["result"][:800], language="text")
+
+            elif kind == "final":
+                result = event["result"]
+
+        dt = time.time() - t0
 
         status.update(
             label=f"done — {result['total_steps']} steps, {result['tool_calls']} tools, {dt:.1f}s",
@@ -246,32 +305,6 @@ if st.button("run", type="primary", use_container_width=True):
             expanded=True,
         )
 
-        for step in result["steps"]:
-            with sc:
-                for a in step["actions"]:
-                    if a["type"] == "thought":
-                        txt = a["content"][:400]
-                        if len(a["content"]) > 400:
-                            txt += "..."
-                        st.markdown(
-                            f'<div class="s-card">'
-                            f'<div class="s-label">step {step["step"]} — thought</div>'
-                            f'<div class="s-thought">{txt}</div>'
-                            f'</div>',
-                            unsafe_allow_html=True,
-                        )
-                    elif a["type"] == "tool_use":
-                        st.markdown(
-                            f'<div class="s-card">'
-                            f'<div class="s-label">step {step["step"]} — tool</div>'
-                            f'<div class="s-tool">{a["tool"]}</div>'
-                            f'</div>',
-                            unsafe_allow_html=True,
-                        )
-                        with st.expander(f"{a['tool']} details"):
-                            st.json(a["input"])
-                            st.code(a["result"][:800], language="text")
-
         st.markdown("---")
         st.markdown(result["result"])
 
@@ -280,6 +313,9 @@ if st.button("run", type="primary", use_container_width=True):
             f'<span>steps <span class="m-val">{result["total_steps"]}</span></span>'
             f'<span>tool calls <span class="m-val">{result["tool_calls"]}</span></span>'
             f'<span>time <span class="m-val">{dt:.1f}s</span></span>'
+            f'<span>model <span class="m-val">{result["model_time"]:.1f}s</span></span>'
+            f'<span>tools <span class="m-val">{result["tool_time"]:.1f}s</span></span>'
+            f'<span>tokens <span class="m-val">{result["usage"]["input_tokens"] + result["usage"]["output_tokens"]}</span></span>'
             f'</div>',
             unsafe_allow_html=True,
         )
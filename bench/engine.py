@@ -0,0 +1,299 @@
+# bench/engine.py
+# Benchmarks for the agent engine, on a scripted fake model.
+#
+# eval/ scores the answers; this times the machinery around the model, so
+# a slowdown in the loop or the tools shows up here before it shows up in
+# real runs. The model is agent.fake.FakeClient answering instantly from a
+# script, so everything measured is our own overhead. No network, no key.
+#
+# Benchmarks (times in microseconds, lower is better):
+#   loop       per-step cost of AgentForge.run, one no-op tool call per
+#              step and three per step (the parallel dispatch path)
+#   history    per-step request prep with 10 / 50 / 200 steps of history:
+#              compaction, _request_kwargs, the token estimate, JSON encoding
+#   dispatch   a no-op tool called directly, through the registry, and
+#              through execute_tool (validation + result budget)
+#   run_code   a trivial snippet in a warm pool worker vs a fresh process
+#   read_file  head and tail reads of 10KB / 1MB / 10MB files, with the
+#              file cache cold and warm (+ cold MB/s, not compared)
+#
+# Each number is the median of several repeats. --out saves the results
+# as JSON; --baseline compares against a saved file and exits 1 if any
+# time got more than --tolerance slower (and by more than --min-delta-us,
+# so tiny numbers don't fail on noise). Baselines are per machine.
+#
+# Usage:
+#   python -m bench.engine --out bench/baseline.json
+#   python -m bench.engine --baseline bench/baseline.json
+#   python -m bench.engine --only loop,dispatch --quick
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import statistics
+from datetime import datetime
+
+from agent.core import AgentForge
+from agent.fake import FakeClient, message, text, tool_use
+from agent.registry import REGISTRY
+from agent.context import compact_history
+from agent.files import FILE_CACHE
+from agent.cassette import set_cassette
+from agent.sandbox import run_once, get_code_pool
+from agent.tools import execute_tool, read_file
+
+NOOP_TOOL = "bench_noop"
+HISTORY_STEPS = [10, 50, 200]
+FILE_SIZES = {"10KB": 10_000, "1MB": 1_000_000, "10MB": 10_000_000}
+
+# what a tool result in the benchmark history looks like: ~2KB of code
+RESULT_TEXT = "".join(f"    value_{i} = compute(value_{i - 1}, config)  # step {i}\n" for i in range(40))
+
+
+def bench_noop(value: str = "") -> str:
+    """Returns value unchanged. Only registered while benchmarks run."""
+    return value
+
+
+def timed(fn, repeat: int, warmup: int = 1, inner: int = 1) -> float:
+    """Median seconds per call of fn, over repeat rounds of inner calls each."""
+    for _ in range(warmup):
+        fn()
+    rounds = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(inner):
+            fn()
+        rounds.append((time.perf_counter() - t0) / inner)
+    return statistics.median(rounds)
+
+
+def us(seconds: float) -> float:
+    return round(seconds * 1e6, 1)
+
+
+# -- benchmarks. each returns {metric name: value} --
+
+def bench_loop(quick: bool = False) -> dict:
+    steps = 20 if quick else 50
+    repeat = 3 if quick else 7
+    metrics = {}
+    for label, tools_per_step in (("step_us", 1), ("step_3tools_us", 3)):
+        respond = _scripted_steps(steps, tools_per_step)
+
+        def run():
+            agent = AgentForge(client=FakeClient(respond))
+            agent.max_steps = steps
+            agent.run("benchmark", verbose=False)
+
+        metrics[f"loop.{label}"] = us(timed(run, repeat) / steps)
+    return metrics
+
+
+def bench_history(quick: bool = False) -> dict:
+    repeat = 5 if quick else 20
+    metrics = {}
+    for steps in HISTORY_STEPS:
+        agent = AgentForge(client=FakeClient())
+        agent._start("benchmark", verbose=False)
+        agent.messages = _history(steps)
+
+        # compaction first: it stubs old results in place, and the rest
+        # should see the history the way the loop does - already compacted
+        metrics[f"history.{steps}.compact_us"] = us(timed(
+            lambda: compact_history(agent.messages, keep_recent=agent.keep_recent_results, token_budget=agent.context_budget),
+            repeat,
+        ))
+        metrics[f"history.{steps}.request_us"] = us(timed(agent._request_kwargs, repeat))
+        metrics[f"history.{steps}.estimate_us"] = us(timed(agent._estimate_request, repeat))
+        # roughly what the SDK does to put the request on the wire
+        metrics[f"history.{steps}.encode_us"] = us(timed(lambda: json.dumps(agent._request_kwargs(), default=vars), repeat))
+    return metrics
+
+
+def bench_dispatch(quick: bool = False) -> dict:
+    repeat = 5 if quick else 15
+    inner = 200 if quick else 1000
+    args = {"value": "x" * 200}
+    return {
+        "dispatch.direct_us": us(timed(lambda: bench_noop(**args), repeat, inner=inner)),
+        "dispatch.registry_us": us(timed(lambda: REGISTRY.call(NOOP_TOOL, args), repeat, inner=inner)),
+        "dispatch.execute_tool_us": us(timed(lambda: execute_tool(NOOP_TOOL, args), repeat, inner=inner)),
+    }
+
+
+def bench_run_code(quick: bool = False) -> dict:
+    repeat = 3 if quick else 10
+    metrics = {}
+    if get_code_pool() is not None:
+        get_code_pool().start()
+        metrics["run_code.pool_us"] = us(timed(lambda: execute_tool("run_code", {"code": "pass"}), repeat, warmup=2))
+
+    with tempfile.NamedTemporaryFile(mode="w", suffix=".py", delete=False) as tmp:
+        tmp.write("pass\n")
+    try:
+        metrics["run_code.fresh_process_us"] = us(timed(lambda: run_once(tmp.name, timeout=30), repeat))
+    finally:
+        os.unlink(tmp.name)
+    return metrics
+
+
+def bench_read_file(quick: bool = False) -> dict:
+    repeat = 3 if quick else 10
+    sizes = {k: v for k, v in FILE_SIZES.items() if not (quick and v > 1_000_000)}
+    metrics = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for label, size in sizes.items():
+            path = os.path.join(tmp_dir, f"bench_{label}.py")
+            with open(path, "w") as f:
+                f.write((RESULT_TEXT * (size // len(RESULT_TEXT) + 1))[:size])
+            total_lines = size // (len(RESULT_TEXT) // 40)
+
+            reads = {
+                "head": lambda: read_file(path),
+                "tail": lambda: read_file(path, start_line=max(1, total_lines - 100)),
+            }
+            for name, read in reads.items():
+                def cold():
+                    FILE_CACHE.clear()
+                    return read()
+
+                cold_s = timed(cold, repeat)
+                metrics[f"read_file.{label}.{name}_cold_us"] = us(cold_s)
+                metrics[f"read_file.{label}.{name}_warm_us"] = us(timed(read, repeat))
+                if name == "head":
+                    # a cold read indexes the whole file, so this is file size / time
+                    metrics[f"read_file.{label}.cold_mb_s"] = round(size / cold_s / 1e6, 1)
+    FILE_CACHE.clear()
+    return metrics
+
+
+BENCHMARKS = {
+    "loop": bench_loop,
+    "history": bench_history,
+    "dispatch": bench_dispatch,
+    "run_code": bench_run_code,
+    "read_file": bench_read_file,
+}
+
+
+def run(names: list = None, quick: bool = False, verbose: bool = True) -> dict:
+    """Runs the named benchmarks (default all). Returns the result dict that --out saves."""
+    previous = set_cassette(None)  # a cassette would replay the tools instead of running them
+    REGISTRY.register(bench_noop, name=NOOP_TOOL)
+    metrics = {}
+    try:
+        for name in names or list(BENCHMARKS):
+            if verbose:
+                print(f"running {name}...", file=sys.stderr)
+            metrics.update(BENCHMARKS[name](quick))
+    finally:
+        REGISTRY.remove(NOOP_TOOL)
+        set_cassette(previous)
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}",
+        "cpus": os.cpu_count(),
+        "quick": quick,
+        "metrics": metrics,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float = 0.25, min_delta_us: float = 5.0) -> list:
+    """
+    Prints current vs baseline for every time both have. Returns failure
+    messages for the ones more than tolerance (and min_delta_us) slower.
+    """
+    failures = []
+    now, before = current["metrics"], baseline["metrics"]
+    print(f"\n{'metric':<36} {'baseline':>12} {'now':>12} {'change':>8}")
+    for name in sorted(set(now) & set(before)):
+        if not name.endswith("_us") or not before[name]:
+            continue
+        change = now[name] / before[name] - 1
+        slower = change > tolerance and now[name] - before[name] > min_delta_us
+        flag = "  SLOWER" if slower else ""
+        print(f"{name:<36} {before[name]:>12.1f} {now[name]:>12.1f} {change:>+7.0%}{flag}")
+        if slower:
+            failures.append(f"{name}: {before[name]:.1f} -> {now[name]:.1f} us ({change:+.0%})")
+    ran = {name.split(".")[0] for name in now}
+    missing = sorted(name for name in set(before) - set(now) if name.split(".")[0] in ran)
+    if missing:
+        print(f"(not measured this time: {', '.join(missing)})")
+    return failures
+
+
+def report(result: dict):
+    print(f"\n{'metric':<36} {'value':>12}")
+    for name, value in result["metrics"].items():
+        unit = "MB/s" if name.endswith("_mb_s") else "us"
+        print(f"{name:<36} {value:>12.1f} {unit}")
+
+
+def _scripted_steps(steps: int, tools_per_step: int):
+    """Responder: tools_per_step no-op calls every step, then an answer on the last step."""
+    def respond(params: dict):
+        done = sum(1 for msg in params["messages"] if msg["role"] == "assistant")
+        if done + 1 >= steps:
+            return message([text("done")], input_tokens=1, output_tokens=1)
+        calls = [tool_use(NOOP_TOOL, {"value": f"call {i}"}) for i in range(tools_per_step)]
+        # usage filled in so FakeClient doesn't estimate it (that would be timed too)
+        return message([text("next step")] + calls, input_tokens=1, output_tokens=1)
+    return respond
+
+
+def _history(steps: int) -> list:
+    """A conversation of steps read_file calls, each with a ~2KB result."""
+    messages = [{"role": "user", "content": "benchmark"}]
+    for i in range(steps):
+        call = tool_use("read_file", {"file_path": f"src/module_{i}.py"}, f"toolu_bench_{i}")
+        messages.append({"role": "assistant", "content": [text(f"Reading module {i} next."), call]})
+        messages.append({"role": "user", "content": [
+            {"type": "tool_result", "tool_use_id": call.id, "content": RESULT_TEXT},
+        ]})
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmarks for the agent loop and tools")
+    parser.add_argument("--only", help=f"comma-separated benchmarks (default all: {','.join(BENCHMARKS)})")
+    parser.add_argument("--quick", action="store_true", help="fewer repeats, skip the biggest file")
+    parser.add_argument("--out", help="save the results as JSON here")
+    parser.add_argument("--baseline", help="compare against results saved earlier with --out")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+    parser.add_argument("--min-delta-us", type=float, default=5.0, help="ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    names = args.only.split(",") if args.only else None
+    unknown = set(names or []) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    result = run(names, quick=args.quick)
+    report(result)
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nsaved: {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        failures = compare(result, baseline, args.tolerance, args.min_delta_us)
+        print()
+        if failures:
+            for failure in failures:
+                print(f"[fail] {failure}")
+            sys.exit(1)
+        print(f"[pass] nothing more than {args.tolerance:.0%} slower than {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# bench/importtime.py
+# Import-time report + regression check for the agent's cold start.
+#
+# Runs `python -X importtime -c "import <module>"` in fresh processes,
+# keeps the fastest of a few runs per module, and prints where the time
+# goes. Then checks:
+# 1. none of the heavy optional dependencies (anthropic, ddgs, httpx,
+#    asyncio, streamlit) get imported just by importing the agent -
+#    they should load on first use. dotenv is the exception: agent/__init__.py
+#    loads .env up front, since some settings are read at import
+# 2. optionally, the total stays under --budget-ms (off by default, since
+#    absolute times depend on the machine)
+#
+# Exits 1 if a check fails, so it can run in CI.
+#
+# Usage:
+#   python -m bench.importtime
+#   python -m bench.importtime --module agent.async_core --top 30 --budget-ms 150
+
+import os
+import sys
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ["agent.core", "agent.tools"]
+
+# must not be imported as a side effect of importing the agent
+DEFERRED = ["anthropic", "ddgs", "httpx", "asyncio", "streamlit"]
+
+# ...except where the module really needs it up front
+ALLOWED = {"agent.async_core": {"asyncio"}}
+
+
+def measure(module: str, runs: int = 5) -> dict:
+    """
+    Returns {"total_us", "modules": {name: (self_us, cumulative_us)}} for the
+    fastest of `runs` fresh imports of module.
+    """
+    best = None
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True,
+            text=True,
+            cwd=ROOT,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+        modules = parse(proc.stderr)
+        total = modules.get(module, (0, 0))[1]
+        if best is None or total < best["total_us"]:
+            best = {"total_us": total, "modules": modules}
+    return best
+
+
+def parse(stderr: str) -> dict:
+    """name -> (self us, cumulative us) from -X importtime output."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # the header line
+        name = parts[2].strip()
+        modules[name] = (int(parts[0]), int(parts[1]))
+    return modules
+
+
+def report(module: str, result: dict, top: int = 15):
+    print(f"\nimport {module}: {result['total_us'] / 1000:.1f} ms ({len(result['modules'])} modules)")
+    print(f"  {'self ms':>8} {'cumul ms':>9}  module")
+    ranked = sorted(result["modules"].items(), key=lambda kv: kv[1][1], reverse=True)
+    for name, (self_us, cumulative_us) in ranked[:top]:
+        print(f"  {self_us / 1000:8.1f} {cumulative_us / 1000:9.1f}  {name}")
+
+
+def check(module: str, result: dict, budget_ms: float = None) -> list:
+    """Returns a list of failure messages (empty if all good)."""
+    failures = []
+    loaded = set(result["modules"])
+    for dep in DEFERRED:
+        if dep in loaded and dep not in ALLOWED.get(module, ()):
+            failures.append(f"import {module} pulls in {dep} - it should be imported on first use")
+    if budget_ms and result["total_us"] / 1000 > budget_ms:
+        failures.append(f"import {module} took {result['total_us'] / 1000:.1f} ms (budget {budget_ms} ms)")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="import-time report for the agent")
+    parser.add_argument("--module", action="append", help="module to measure (repeatable)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    failures = []
+    for module in args.module or MODULES:
+        result = measure(module, args.runs)
+        report(module, result, args.top)
+        failures += check(module, result, args.budget_ms)
+
+    print()
+    if failures:
+        for failure in failures:
+            print(f"[fail] {failure}")
+        sys.exit(1)
+    print("[pass] no heavy dependencies imported at startup")
+
+
+if __name__ == "__main__":
+    main()
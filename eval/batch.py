@@ -0,0 +1,128 @@
+# eval/batch.py
+# Runs eval cases through the Message Batches API, in lockstep.
+#
+# Instead of finishing one case before starting the next, every case
+# advances one step at a time together:
+# 1. each unfinished case's next request goes into one batch
+# 2. wait for the batch to end, then feed each case its response
+# 3. run all the tool calls that came back (across cases, in a thread pool)
+# 4. repeat until every case has answered or hit its step limit
+#
+# So a suite takes about (longest case's steps) x (batch turnaround), not
+# the sum of every run, and batched requests are billed at half price.
+# Batches can take a while to turn around on a busy day, which is why
+# this is for evals and not for anything interactive.
+#
+# client is anything with messages.batches.create/retrieve/results -
+# agent.fake.FakeClient does it locally for offline runs.
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from agent.core import AgentForge
+from agent.clients import get_client
+from agent.cassette import model_client
+from agent.scheduler import get_scheduler
+
+
+def run_batch(
+    cases: list,
+    client=None,
+    poll_interval: float = 10.0,
+    max_tool_workers: int = 8,
+    timeout: float = 24 * 3600,
+    verbose: bool = True,
+    on_result=None,
+) -> dict:
+    """
+    Runs cases in lockstep batches. Returns {case id: result dict} with the
+    same result dicts AgentForge.run returns (or an ERROR result for cases
+    whose requests failed). on_result(case, result) is called as each case
+    finishes, so callers can save results without waiting for the slowest case.
+    """
+    client = client or model_client(get_client)
+    agents = {}
+    for i, tc in enumerate(cases):
+        agent = AgentForge(mode=tc["mode"], priority="batch", client=client)
+        agent._start(tc["task"], verbose=False)
+        # custom_id has to be short and [a-zA-Z0-9_-], so don't trust case ids with it
+        agents[f"case-{i}"] = (tc, agent)
+
+    results = {}
+    started = time.monotonic()
+
+    def finish(tc: dict, result: dict):
+        results[tc["id"]] = result
+        if on_result is not None:
+            on_result(tc, result)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_tool_workers)) as pool:
+        while len(results) < len(agents):
+            active = {cid: pair for cid, pair in agents.items() if pair[0]["id"] not in results}
+
+            requests = []
+            for cid, (tc, agent) in active.items():
+                agent.total_steps += 1
+                requests.append({"custom_id": cid, "params": agent._request_kwargs()})
+
+            step = max(agent.total_steps for _, agent in active.values())
+            if verbose:
+                print(f"  batch step {step}: {len(requests)} requests")
+
+            t0 = time.perf_counter()
+            try:
+                responses = _run_batch(client, requests, poll_interval, started + timeout)
+            except Exception as e:
+                # the whole batch failed - every case still running gets the error
+                for tc, agent in active.values():
+                    finish(tc, _error_result(agent, f"batch failed: {str(e)}"))
+                break
+            latency = time.perf_counter() - t0
+
+            # feed every case its response; their tools run side by side
+            futures = {}
+            for cid, (tc, agent) in active.items():
+                entry = responses.get(cid)
+                if entry is None or entry.result.type != "succeeded":
+                    finish(tc, _error_result(agent, _describe(entry)))
+                    continue
+                futures[cid] = pool.submit(agent._step, entry.result.message, False, latency)
+
+            for cid, future in futures.items():
+                tc, agent = agents[cid]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = _error_result(agent, str(e))
+                if result is None and agent.total_steps >= agent.max_steps:
+                    result = agent._step_limit_result()
+                if result is not None:
+                    finish(tc, result)
+
+    return results
+
+
+def _run_batch(client, requests: list, poll_interval: float, deadline: float) -> dict:
+    """Submits one batch and waits for it. Returns {custom_id: result entry}."""
+    batches = client.messages.batches
+    scheduler = get_scheduler()  # for its retries on 429s / overloads
+    batch = scheduler.call(lambda: batches.create(requests=requests), priority="batch")
+    while batch.processing_status != "ended":
+        if time.monotonic() > deadline:
+            batches.cancel(batch.id)
+            raise TimeoutError(f"batch {batch.id} didn't finish in time")
+        time.sleep(poll_interval)
+        batch = scheduler.call(lambda: batches.retrieve(batch.id), priority="batch")
+    return {entry.custom_id: entry for entry in batches.results(batch.id)}
+
+
+def _describe(entry) -> str:
+    if entry is None:
+        return "no result in batch"
+    error = getattr(entry.result, "error", None)
+    detail = getattr(error, "message", None) or getattr(getattr(error, "error", None), "message", None)
+    return f"batch request {entry.result.type}" + (f": {detail}" if detail else "")
+
+
+def _error_result(agent: AgentForge, message: str) -> dict:
+    return agent._result(f"ERROR: {message}")
@@ -0,0 +1,295 @@
+# eval/cases.py
+# Eval cases, loaded from files instead of a Python list.
+#
+# Cases live under eval/cases/ (any depth), one case per line in .jsonl
+# files, or as YAML (.yaml / .yml: one case per document, or a list of
+# them - needs pyyaml). A case:
+#
+#   {"id": "search_01", "task": "...", "mode": "general",
+#    "description": "...", "tags": ["search", "smoke"],
+#    "expected_tools": ["web_search"], "expected_keywords": ["react"], "max_steps": 5}
+#
+# only id, task and mode are required. The rest have defaults (see DEFAULTS).
+#
+# CaseIndex scans the files once and keeps just enough to pick cases:
+# id -> where it is (file + byte offset for JSONL), plus tag -> ids and
+# mode -> ids. The cases themselves are only read when they're selected, so
+# picking 20 cases out of a few thousand doesn't hold the other thousands
+# in memory.
+#
+# Selection: ids, tags and modes combine with AND. Several values of the
+# same kind combine with OR, and a tag starting with "!" excludes:
+#   index.select(tags=["research", "!slow"], modes=["general"])
+#
+# python -m eval.cases lists what a selection picks; --validate checks
+# every case (required fields, types, known modes and tools, unknown
+# fields, duplicate ids) and exits 1 if anything's wrong.
+
+import os
+import json
+import argparse
+
+from agent.core import PROMPTS
+from agent.registry import REGISTRY
+
+CASES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cases")
+
+DEFAULTS = {
+    "description": None,  # the id
+    "tags": [],
+    "expected_tools": [],
+    "expected_keywords": [],
+    "max_steps": 10,
+}
+REQUIRED = ("id", "task", "mode")
+EXTENSIONS = (".jsonl", ".yaml", ".yml")
+
+
+class CaseIndex:
+
+    def __init__(self, root: str = CASES_DIR):
+        self.root = root
+        self.entries = {}    # id -> {"file", "offset" (jsonl) or "position" (yaml), "source"}
+        self.by_tag = {}     # tag -> [ids]
+        self.by_mode = {}    # mode -> [ids]
+        self.problems = []   # "file:line: message" - found while indexing
+        self._yaml = {}      # yaml file -> its cases, parsed on first use
+        self.build()
+
+    def build(self):
+        self.entries.clear()
+        self.by_tag.clear()
+        self.by_mode.clear()
+        self.problems.clear()
+        self._yaml.clear()
+        for path in self.files():
+            if path.endswith(".jsonl"):
+                self._index_jsonl(path)
+            else:
+                self._index_yaml(path)
+
+    def files(self) -> list:
+        if not os.path.isdir(self.root):
+            return []
+        found = []
+        for directory, subdirs, names in os.walk(self.root):
+            subdirs.sort()
+            found += [os.path.join(directory, n) for n in sorted(names) if n.endswith(EXTENSIONS)]
+        return found
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, case_id: str):
+        return case_id in self.entries
+
+    def get(self, case_id: str) -> dict:
+        """Reads one case from its file, with defaults filled in."""
+        entry = self.entries[case_id]
+        if "offset" in entry:
+            with open(entry["file"], "rb") as f:
+                f.seek(entry["offset"])
+                case = json.loads(f.readline())
+        else:
+            if entry["file"] not in self._yaml:
+                self._yaml[entry["file"]] = [case for case, _ in _read_yaml(entry["file"])]
+            case = self._yaml[entry["file"]][entry["position"]]
+        return with_defaults(case)
+
+    def load(self, ids: list):
+        """The cases for ids, read one at a time (a generator)."""
+        for case_id in ids:
+            yield self.get(case_id)
+
+    def select(self, ids: list = None, tags: list = None, modes: list = None) -> list:
+        """
+        Ids of the matching cases, in file order (or in the order given, for
+        ids). Raises ValueError for ids that aren't in the index.
+        """
+        if ids:
+            unknown = [i for i in ids if i not in self.entries]
+            if unknown:
+                raise ValueError(f"unknown case ids: {', '.join(unknown)}")
+            selected = list(ids)
+        else:
+            selected = list(self.entries)
+
+        include = [t for t in tags or [] if not t.startswith("!")]
+        exclude = [t[1:] for t in tags or [] if t.startswith("!")]
+        if include:
+            wanted = self._ids_for(self.by_tag, include)
+            selected = [i for i in selected if i in wanted]
+        if exclude:
+            unwanted = self._ids_for(self.by_tag, exclude)
+            selected = [i for i in selected if i not in unwanted]
+        if modes:
+            wanted = self._ids_for(self.by_mode, modes)
+            selected = [i for i in selected if i in wanted]
+        return selected
+
+    def validate(self, ids: list = None) -> list:
+        """Problems with the cases (all of them by default), as "source: message" strings."""
+        problems = list(self.problems) if ids is None else []
+        for case_id in ids if ids is not None else list(self.entries):
+            source = self.entries[case_id]["source"]
+            try:
+                case = self.get(case_id)
+            except Exception as e:
+                problems.append(f"{source}: can't read case {case_id!r}: {str(e)}")
+                continue
+            problems += [f"{source}: {case_id}: {error}" for error in validate_case(case)]
+        return problems
+
+    def _add(self, case, path: str, source: str, **location):
+        if not isinstance(case, dict):
+            self.problems.append(f"{source}: expected a case (an object), got {type(case).__name__}")
+            return
+        case_id = case.get("id")
+        if not isinstance(case_id, str) or not case_id:
+            self.problems.append(f"{source}: case has no id")
+            return
+        if case_id in self.entries:
+            self.problems.append(f"{source}: duplicate id {case_id!r} (first in {self.entries[case_id]['source']})")
+            return
+        self.entries[case_id] = {"file": path, "source": source, **location}
+        tags = case.get("tags") or []
+        for tag in tags if isinstance(tags, list) else []:
+            self.by_tag.setdefault(str(tag), []).append(case_id)
+        self.by_mode.setdefault(str(case.get("mode")), []).append(case_id)
+
+    def _index_jsonl(self, path: str):
+        with open(path, "rb") as f:
+            line_no = 0
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                line_no += 1
+                if not line.strip():
+                    continue
+                source = f"{os.path.relpath(path)}:{line_no}"
+                try:
+                    case = json.loads(line)
+                except json.JSONDecodeError as e:
+                    self.problems.append(f"{source}: bad JSON: {e.msg}")
+                    continue
+                self._add(case, path, source, offset=offset)
+
+    def _index_yaml(self, path: str):
+        try:
+            cases = list(_read_yaml(path))
+        except Exception as e:
+            self.problems.append(f"{os.path.relpath(path)}: {str(e)}")
+            return
+        for position, (case, line_no) in enumerate(cases):
+            self._add(case, path, f"{os.path.relpath(path)}:{line_no}", position=position)
+
+    def _ids_for(self, index: dict, keys: list) -> set:
+        ids = set()
+        for key in keys:
+            ids.update(index.get(key, []))
+        return ids
+
+
+def with_defaults(case: dict) -> dict:
+    filled = {key: (list(value) if isinstance(value, list) else value) for key, value in DEFAULTS.items()}
+    filled.update(case)
+    if filled["description"] is None:
+        filled["description"] = filled.get("id")
+    return filled
+
+
+def validate_case(case: dict) -> list:
+    """What's wrong with one case (empty list if nothing)."""
+    errors = []
+    for field in REQUIRED:
+        if not isinstance(case.get(field), str) or not case.get(field).strip():
+            errors.append(f"{field} is required (a non-empty string)")
+    if "#" in str(case.get("id", "")):
+        errors.append("id can't contain '#' (it marks trials)")
+    if case.get("mode") and case["mode"] not in PROMPTS:
+        errors.append(f"unknown mode {case['mode']!r} (expected one of {', '.join(PROMPTS)})")
+
+    for field in ("tags", "expected_tools", "expected_keywords"):
+        value = case.get(field, [])
+        if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+            errors.append(f"{field} should be a list of strings")
+    tools = case.get("expected_tools", [])
+    if isinstance(tools, list):
+        known = set(REGISTRY.names())
+        unknown = [t for t in tools if isinstance(t, str) and t not in known]
+        if unknown:
+            errors.append(f"unknown tools in expected_tools: {', '.join(unknown)}")
+
+    max_steps = case.get("max_steps", 1)
+    if isinstance(max_steps, bool) or not isinstance(max_steps, int) or max_steps < 1:
+        errors.append("max_steps should be a positive integer")
+
+    unknown_fields = set(case) - set(REQUIRED) - set(DEFAULTS)
+    if unknown_fields:
+        errors.append(f"unknown fields: {', '.join(sorted(unknown_fields))}")
+    return errors
+
+
+def _read_yaml(path: str):
+    """(case, line number) pairs from a YAML file: one case per document, or a list per document."""
+    try:
+        import yaml
+    except ImportError:
+        raise RuntimeError("YAML cases need pyyaml (pip install pyyaml) - skipped") from None
+
+    with open(path) as f:
+        loader = yaml.SafeLoader(f)
+        try:
+            while loader.check_node():
+                node = loader.get_node()
+                items = node.value if isinstance(node, yaml.SequenceNode) else [node]
+                for item in items:
+                    yield loader.construct_document(item), item.start_mark.line + 1
+        finally:
+            loader.dispose()
+
+
+_indexes = {}
+
+
+def get_index(root: str = None) -> CaseIndex:
+    """The index for root (default eval/cases/), built on first use."""
+    root = os.path.abspath(root or CASES_DIR)
+    if root not in _indexes:
+        _indexes[root] = CaseIndex(root)
+    return _indexes[root]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="list / validate eval cases")
+    parser.add_argument("--cases", help=f"cases directory (default {os.path.relpath(CASES_DIR)})")
+    parser.add_argument("--ids", help="comma-separated case ids")
+    parser.add_argument("--tag", action="append", help="only cases with this tag (repeatable, !tag excludes)")
+    parser.add_argument("--mode", action="append", help="only cases in this mode (repeatable)")
+    parser.add_argument("--validate", action="store_true", help="check the selected cases, exit 1 on problems")
+    args = parser.parse_args()
+
+    index = get_index(args.cases)
+    ids = index.select(args.ids.split(",") if args.ids else None, args.tag, args.mode)
+    print(f"{len(ids)} of {len(index)} cases in {len(index.files())} files")
+    print(f"tags: {', '.join(f'{t} ({len(v)})' for t, v in sorted(index.by_tag.items()))}")
+    print(f"modes: {', '.join(f'{m} ({len(v)})' for m, v in sorted(index.by_mode.items()))}")
+
+    if not args.validate:
+        for case_id in ids:
+            print(f"  {case_id:<24} {index.entries[case_id]['source']}")
+        return
+
+    everything = not (args.ids or args.tag or args.mode)
+    problems = index.validate(None if everything else ids)
+    for problem in problems:
+        print(f"[fail] {problem}")
+    if problems:
+        raise SystemExit(1)
+    print("[pass] all cases valid")
+
+
+if __name__ == "__main__":
+    main()
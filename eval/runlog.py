@@ -0,0 +1,74 @@
+# eval/runlog.py
+# Append-only JSONL file of scored eval cases, one line per finished case.
+#
+# run_eval writes each case the moment it's scored (flushed to disk), so
+# a crash or a Ctrl-C only loses the cases that were still running. Point
+# a new run at the same file and it picks up where the last one stopped:
+# cases already in it are skipped. Cases that ended in an ERROR don't
+# count as finished, so a resumed run tries them again - when an id shows
+# up more than once, the newest line wins.
+#
+# Shards run on different machines each write their own file;
+# load_results() reads several back as one run.
+
+import os
+import json
+import threading
+
+
+class ResultLog:
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self) -> dict:
+        """{test id: score} for every case in the file, newest line per id."""
+        scores = {}
+        if not os.path.exists(self.path):
+            return scores
+        with open(self.path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    score = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # the last line of a run that died mid-write
+                scores[score["test_id"]] = score
+        return scores
+
+    def finished(self) -> set:
+        """Ids that don't need running again."""
+        return {test_id for test_id, score in self.load().items() if not is_error(score)}
+
+    def append(self, score: dict):
+        line = json.dumps(score, default=str) + "\n"
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a") as f:
+                if f.tell() and not self._ends_with_newline():
+                    line = "\n" + line  # don't glue onto a line cut short by a crash
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+
+def load_results(paths: list) -> dict:
+    """Several result files (e.g. one per shard) read as one run. Later files win on duplicate ids."""
+    scores = {}
+    for path in paths:
+        scores.update(ResultLog(path).load())
+    return scores
+
+
+def is_error(score: dict) -> bool:
+    return score.get("raw_result", "").startswith("ERROR:")
@@ -0,0 +1,272 @@
+# eval/stats.py
+# Latency / cost percentiles over eval runs, and A/B comparison of two runs.
+#
+# One run per case doesn't say much: the agent is stochastic, so wall time
+# and step counts move around from run to run. Run each case several times
+# (run_eval(trials=N) / --trials N) and this summarizes the spread of each
+# metric - n, mean, p50, p95, p99, max - over all runs and per case.
+#
+# compare() diffs two sets of results metric by metric, on the cases they
+# have in common. The intervals treat the case mix as fixed and only the
+# run-to-run noise within each case as random: a normal interval for the
+# change in mean, and a stratified bootstrap (runs resampled within each
+# case) for the change in p95. A change whose 95% interval doesn't
+# include 0 is flagged as real. That needs at least 2 runs of every shared
+# case on both sides - with one run per case (the default) there's no
+# run-to-run noise to measure, so no intervals are given at all.
+#
+# Usage:
+#   python -m eval.stats report eval/results/run_X.jsonl [--by-case]
+#   python -m eval.stats compare eval/results/before.jsonl eval/results/after.jsonl
+# (summary files - eval/results/eval_*.json - work too)
+
+import json
+import math
+import random
+import argparse
+import statistics
+from statistics import NormalDist
+
+from eval.runlog import ResultLog
+
+# metric -> how to read it off a score
+METRICS = {
+    "wall_time": lambda s: s.get("wall_time", 0.0),
+    "steps": lambda s: s.get("steps_used", 0),
+    "tool_calls": lambda s: s.get("tool_calls", 0),
+    "input_tokens": lambda s: s.get("usage", {}).get("input_tokens", 0),
+    "output_tokens": lambda s: s.get("usage", {}).get("output_tokens", 0),
+    "score": lambda s: s.get("overall_score", 0.0),
+}
+
+
+def percentile(values: list, p: float) -> float:
+    """p-th percentile (0-100) of values, interpolating between ranks."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = (len(ordered) - 1) * p / 100
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def describe(values: list) -> dict:
+    if not values:
+        return {"n": 0}
+    return {
+        "n": len(values),
+        "mean": round(sum(values) / len(values), 3),
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "max": round(max(values), 3),
+    }
+
+
+def group_by_case(scores: list) -> dict:
+    """{case id: [scores]} - trials of the same case share a case_id."""
+    groups = {}
+    for score in scores:
+        groups.setdefault(score.get("case_id", score["test_id"]), []).append(score)
+    return groups
+
+
+def summarize_runs(scores: list) -> dict:
+    """Per-metric spread over every run, and per case."""
+    groups = group_by_case(scores)
+    return {
+        "runs": len(scores),
+        "cases": len(groups),
+        "overall": {name: describe([read(s) for s in scores]) for name, read in METRICS.items()},
+        "by_case": {
+            case: {name: describe([read(s) for s in runs]) for name, read in METRICS.items()}
+            for case, runs in groups.items()
+        },
+    }
+
+
+def compare(before: list, after: list, resamples: int = 1000, confidence: float = 0.95, seed: int = 0) -> dict:
+    """
+    Metric by metric, how after differs from before on their shared cases:
+    the change in mean and in p95 (relative, so +0.10 = 10% higher) with a
+    confidence interval for each. The intervals (and *_significant) are
+    None if any shared case has fewer than 2 runs on either side - those
+    cases are listed under "too_few_runs".
+    """
+    groups_before = group_by_case(before)
+    groups_after = group_by_case(after)
+    shared = sorted(set(groups_before) & set(groups_after))
+    too_few = [case for case in shared if len(groups_before[case]) < 2 or len(groups_after[case]) < 2]
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+
+    values = {}
+    for name, read in METRICS.items():
+        values[name] = (
+            [[read(s) for s in groups_before[case]] for case in shared],
+            [[read(s) for s in groups_after[case]] for case in shared],
+        )
+    # with a single run the within-case variance is 0 and every interval
+    # would have zero width, flagging pure noise as a change
+    p95_changes = {} if too_few else _bootstrap_p95(values, resamples, random.Random(seed))
+    tail = (1 - confidence) / 2 * 100
+
+    out = {
+        "cases": len(shared),
+        "unmatched": sorted(set(groups_before) ^ set(groups_after)),
+        "too_few_runs": too_few,
+        "metrics": {},
+    }
+    for name, (a, b) in values.items():
+        flat_a = [x for runs in a for x in runs]
+        flat_b = [x for runs in b for x in runs]
+        entry = {"before": describe(flat_a), "after": describe(flat_b)}
+
+        # mean: normal approximation, with the variance taken within cases
+        # (the stratified bootstrap's answer, without the resampling)
+        change = _change(_mean(flat_a), _mean(flat_b))
+        entry["mean_change"] = change
+        entry["mean_ci"] = entry["mean_significant"] = None
+        if change is not None and not too_few:
+            ratio = _mean(flat_b) / _mean(flat_a)
+            spread = ratio * math.sqrt(_rel_var(a) + _rel_var(b))
+            entry["mean_ci"] = [round(change - z * spread, 4), round(change + z * spread, 4)]
+            entry["mean_significant"] = entry["mean_ci"][0] > 0 or entry["mean_ci"][1] < 0
+
+        # p95: no formula for that, so bootstrap it
+        change = _change(percentile(flat_a, 95), percentile(flat_b, 95))
+        changes = sorted(p95_changes.get(name, []))
+        entry["p95_change"] = change
+        entry["p95_ci"] = entry["p95_significant"] = None
+        if change is not None and changes:
+            low, high = percentile(changes, tail), percentile(changes, 100 - tail)
+            entry["p95_ci"] = [round(low, 4), round(high, 4)]
+            entry["p95_significant"] = low > 0 or high < 0
+        out["metrics"][name] = entry
+    return out
+
+
+def load_scores(path: str) -> list:
+    """Scores from a run's JSONL file or a summary JSON (eval_*.json)."""
+    if path.endswith(".jsonl"):
+        return list(ResultLog(path).load().values())
+    with open(path) as f:
+        return json.load(f)["results"]
+
+
+def print_summary(summary: dict, by_case: bool = False):
+    print(f"{summary['runs']} runs of {summary['cases']} cases")
+    _print_table(summary["overall"])
+    if by_case:
+        for case, metrics in summary["by_case"].items():
+            print(f"\n{case}")
+            _print_table(metrics)
+
+
+def print_comparison(result: dict, labels: tuple = ("before", "after")):
+    print(f"{result['cases']} shared cases")
+    if result["unmatched"]:
+        print(f"(only in one of them, skipped: {', '.join(result['unmatched'])})")
+    if result["too_few_runs"]:
+        print(f"warning: {len(result['too_few_runs'])} cases have fewer than 2 runs on one side, "
+              f"so there's no run-to-run noise to measure - no confidence intervals. "
+              f"Re-run both with --trials 2 or more.")
+    print(f"\n{'metric':<14} {labels[0] + ' mean':>12} {labels[1] + ' mean':>12} {'change':>8}  {'CI':<18} "
+          f"{labels[0] + ' p95':>11} {labels[1] + ' p95':>11} {'change':>8}  {'CI':<18}")
+    for name, m in result["metrics"].items():
+        if not m["before"]["n"]:
+            continue
+        print(f"{name:<14} {m['before']['mean']:>12.2f} {m['after']['mean']:>12.2f} {_fmt_change(m, 'mean')} "
+              f"{m['before']['p95']:>11.2f} {m['after']['p95']:>11.2f} {_fmt_change(m, 'p95')}")
+    if not result["too_few_runs"]:
+        print("\n* = the interval doesn't include 0")
+
+
+def _print_table(metrics: dict):
+    print(f"  {'metric':<14} {'mean':>10} {'p50':>10} {'p95':>10} {'p99':>10} {'max':>10}")
+    for name, d in metrics.items():
+        if d["n"]:
+            print(f"  {name:<14} {d['mean']:>10.2f} {d['p50']:>10.2f} {d['p95']:>10.2f} {d['p99']:>10.2f} {d['max']:>10.2f}")
+
+
+def _fmt_change(m: dict, stat: str) -> str:
+    change, ci = m[f"{stat}_change"], m[f"{stat}_ci"]
+    if change is None:
+        return f"{'n/a':>8}  {'':<18}"
+    mark = "*" if m.get(f"{stat}_significant") else " "
+    interval = f"[{ci[0]:+.0%}, {ci[1]:+.0%}]" if ci else ""
+    return f"{change:>+7.1%}{mark} {interval:<18}"
+
+
+def _bootstrap_p95(values: dict, resamples: int, rng: random.Random) -> dict:
+    """
+    {metric: relative p95 changes} over stratified resamples: runs are
+    redrawn within each case, the same draw used for every metric.
+    """
+    changes = {name: [] for name in values}
+    if not values:
+        return changes
+    a, b = next(iter(values.values()))
+    sizes = [(len(runs_a), len(runs_b)) for runs_a, runs_b in zip(a, b)]
+    for _ in range(resamples):
+        picks = [(rng.choices(range(n_a), k=n_a), rng.choices(range(n_b), k=n_b)) for n_a, n_b in sizes]
+        for name, (a, b) in values.items():
+            change = _change(
+                percentile([a[c][i] for c, (pick, _) in enumerate(picks) for i in pick], 95),
+                percentile([b[c][i] for c, (_, pick) in enumerate(picks) for i in pick], 95),
+            )
+            if change is not None:
+                changes[name].append(change)
+    return changes
+
+
+def _rel_var(groups: list) -> float:
+    """Variance of the pooled mean, relative to its square, with runs varying only within their case."""
+    n = sum(len(runs) for runs in groups)
+    mean = sum(x for runs in groups for x in runs) / n if n else 0.0
+    if not mean:
+        return 0.0
+    within = sum(len(runs) * statistics.variance(runs) for runs in groups if len(runs) > 1)
+    return within / n ** 2 / mean ** 2
+
+
+def _change(before: float, after: float):
+    if not before:
+        return None
+    return after / before - 1
+
+
+def _mean(values: list) -> float:
+    return sum(values) / len(values) if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="percentiles and A/B comparison of eval results")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    report = commands.add_parser("report", help="percentiles for one set of results")
+    report.add_argument("paths", nargs="+", help="result files (JSONL runs or summary JSON), read as one")
+    report.add_argument("--by-case", action="store_true")
+
+    diff = commands.add_parser("compare", help="before vs after, with confidence intervals")
+    diff.add_argument("before")
+    diff.add_argument("after")
+    diff.add_argument("--resamples", type=int, default=1000, help="bootstrap resamples, for the p95 intervals")
+    diff.add_argument("--confidence", type=float, default=0.95)
+    diff.add_argument("--json", action="store_true", help="print the comparison as JSON")
+    args = parser.parse_args()
+
+    if args.command == "report":
+        scores = [s for path in args.paths for s in load_scores(path)]
+        print_summary(summarize_runs(scores), by_case=args.by_case)
+        return
+
+    result = compare(load_scores(args.before), load_scores(args.after), args.resamples, args.confidence)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_comparison(result)
+
+
+if __name__ == "__main__":
+    main()
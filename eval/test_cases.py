@@ -1,60 +1,23 @@
 # eval/test_cases.py
-# Runs the agent against predefined test cases and scores the results.
+# Runs the agent against test cases and scores the results.
 # Flags anything that scores below 60 as a "bad case" for investigation.
+# The cases themselves live in eval/cases/ (see eval/cases.py).
 
 import json
 import os
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from datetime import datetime
 from agent.core import AgentForge
-
-
-TEST_CASES = [
-    {
-        "id": "search_01",
-        "description": "simple factual search",
-        "task": "What is the ReAct framework for AI agents? Explain it briefly.",
-        "mode": "general",
-        "expected_tools": ["web_search"],
-        "expected_keywords": ["reason", "act", "observation", "tool", "loop"],
-        "max_steps": 5,
-    },
-    {
-        "id": "search_02",
-        "description": "multi-source comparison",
-        "task": "Compare Dify and Coze as low-code AI agent platforms. Pros and cons of each.",
-        "mode": "research",
-        "expected_tools": ["web_search"],
-        "expected_keywords": ["dify", "coze", "low-code", "agent"],
-        "max_steps": 8,
-    },
-    {
-        "id": "code_01",
-        "description": "code generation + execution",
-        "task": "Write a Python function that checks if a string is a palindrome, then test it with 5 examples by running the code.",
-        "mode": "general",
-        "expected_tools": ["run_code"],
-        "expected_keywords": ["palindrome", "true", "false"],
-        "max_steps": 5,
-    },
-    {
-        "id": "code_02",
-        "description": "file creation + verification",
-        "task": "Create a Python file called 'hello_agent.py' that prints 'AgentForge is working!' and then run it to verify.",
-        "mode": "general",
-        "expected_tools": ["write_file", "run_code"],
-        "expected_keywords": ["agentforge", "working"],
-        "max_steps": 5,
-    },
-    {
-        "id": "research_01",
-        "description": "broad research + synthesis",
-        "task": "What are the top 3 AI agent frameworks in 2025? Compare their features briefly.",
-        "mode": "research",
-        "expected_tools": ["web_search"],
-        "expected_keywords": ["langchain", "agent", "framework"],
-        "max_steps": 8,
-    },
-]
+from agent.tools import SEARCH_CACHE
+from agent.fake import FakeClient
+from agent.cassette import Cassette, get_cassette, set_cassette, MODES as CASSETTE_MODES
+from agent.search import set_search_backend, StubBackend
+from eval.batch import run_batch
+from eval.runlog import ResultLog, load_results
+from eval.stats import summarize_runs, print_summary
+from eval.cases import get_index
 
 
 def score_run(test_case: dict, result: dict) -> dict:
@@ -121,69 +84,308 @@ def score_run(test_case: dict, result: dict) -> dict:
     }
 
 
-def run_eval(test_ids: list = None, verbose: bool = True) -> list:
-    """Runs test cases and prints a report. Saves results to eval/results/."""
-    cases = TEST_CASES
-    if test_ids:
-        cases = [tc for tc in TEST_CASES if tc["id"] in test_ids]
+def run_eval(
+    test_ids: list = None,
+    verbose: bool = True,
+    runner: str = "serial",
+    workers: int = 4,
+    client=None,
+    offline: bool = False,
+    shard: tuple = None,
+    results_path: str = None,
+    trials: int = 1,
+    tags: list = None,
+    modes: list = None,
+    cases_dir: str = None,
+) -> list:
+    """
+    Runs test cases and prints a report. Saves results to eval/results/.
+
+    Cases come from cases_dir (default eval/cases/): test_ids, tags and
+    modes pick which (see CaseIndex.select - "!tag" excludes). No selection
+    at all runs every case.
+
+    runner: "serial" (one case at a time), "concurrent" (up to `workers`
+    cases at once in threads), "processes" (same, in worker processes) or
+    "batch" (all cases in lockstep through the Message Batches API - see
+    eval/batch.py). client replaces the API client; offline=True uses
+    agent.fake.FakeClient and the stub search backend instead.
 
-    results = []
-    bad_cases = []
+    shard=(i, n) runs only the i-th of n slices of the suite (1-based), so
+    n machines can split it. Each case is appended to results_path (JSONL,
+    see eval/runlog.py) as soon as it's scored. If that file already has
+    results, those cases are skipped - rerun with the same path to resume.
 
-    print(f"\nRunning {len(cases)} test cases\n{'-'*40}")
+    trials runs every case that many times (as separate cases, "<id>#<n>",
+    so they run side by side with the concurrent runners), and the report
+    gives p50/p95/p99 per metric across them (see eval/stats.py).
+    """
+    cases = expand_trials(select_cases(test_ids, shard, tags, modes, cases_dir), trials)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if results_path is None:
+        results_path = _new_results_path(timestamp, shard)
+    log = ResultLog(results_path)
 
-    for i, tc in enumerate(cases, 1):
-        print(f"[{i}/{len(cases)}] {tc['description']}")
-        print(f"  task: {tc['task'][:80]}...")
+    finished = log.finished()
+    todo = [tc for tc in cases if tc["id"] not in finished]
+    label = runner + (f", shard {shard[0]}/{shard[1]}" if shard else "") + (f", {trials} trials each" if trials > 1 else "")
+    print(f"\nRunning {len(todo)} test cases ({label})\n{'-'*40}")
+    if len(todo) < len(cases):
+        print(f"resuming {results_path}: {len(cases) - len(todo)} already done\n")
 
-        agent = AgentForge(mode=tc["mode"])
-        try:
-            result = agent.run(tc["task"], verbose=False)
-        except Exception as e:
-            result = {
-                "result": f"ERROR: {str(e)}",
-                "steps": [],
-                "tool_calls": 0,
-                "total_steps": 0,
-            }
+    if offline:
+        if client is None and runner != "processes":
+            client = FakeClient()
+        set_search_backend(StubBackend())
 
-        score = score_run(tc, result)
-        score["raw_result"] = result["result"][:500]
-        results.append(score)
+    done = 0
 
-        status = "pass" if not score["is_bad_case"] else "FAIL"
-        print(f"  [{status}] {score['overall_score']}/100 "
-              f"(tools:{score['tool_score']} keywords:{score['keyword_score']} "
-              f"efficiency:{score['efficiency_score']})")
+    def record(tc: dict, result: dict):
+        nonlocal done
+        done += 1
+        score = _score_case(tc, result)
+        log.append(score)
+        _print_score(done, len(todo), tc, score)
 
-        for issue in score["issues"]:
-            print(f"  > {issue}")
-        print()
+    if runner == "batch":
+        run_batch(todo, client=client, verbose=verbose, on_result=record)
+    elif runner in ("concurrent", "processes"):
+        # the shared scheduler keeps the cases inside the rate limits together
+        # (per process - with "processes", each worker has its own)
+        if runner == "processes":
+            if client is not None:
+                raise ValueError("a client can't be shared with worker processes - use offline=True")
+            cassette = get_cassette()
+            if cassette is not None and cassette.mode != "replay":
+                raise ValueError("worker processes can only replay a cassette, not record one")
+            pool = ProcessPoolExecutor(
+                max_workers=max(1, workers),
+                initializer=_init_worker,
+                initargs=(offline, (cassette.path, cassette.mode) if cassette else None),
+            )
+        else:
+            pool = ThreadPoolExecutor(max_workers=max(1, workers))
+        with pool:
+            futures = {pool.submit(_run_case, tc, client): tc for tc in todo}
+            for future in as_completed(futures):
+                record(futures[future], future.result())
+    else:
+        for tc in todo:
+            record(tc, _run_case(tc, client))
 
-        if score["is_bad_case"]:
-            bad_cases.append(score)
+    # the report covers the whole selection, including cases from a resumed run
+    logged = log.load()
+    results = [logged[tc["id"]] for tc in cases if tc["id"] in logged]
+    summarize(results, runner=runner, timestamp=timestamp, results_path=results_path)
+    return results
 
-    # save
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+def summarize(results: list, runner: str = None, timestamp: str = None, results_path: str = None) -> str:
+    """Prints the totals for a list of scores and saves them to eval/results/. Returns the path."""
+    timestamp = timestamp or datetime.now().strftime("%Y%m%d_%H%M%S")
     out_path = f"eval/results/eval_{timestamp}.json"
     os.makedirs("eval/results", exist_ok=True)
 
+    bad_cases = [r for r in results if r["is_bad_case"]]
+    stats = summarize_runs(results)
+    avg = sum(r["overall_score"] for r in results) / len(results) if results else 0.0
+    usage_totals = {}
+    for r in results:
+        for key, value in r["usage"].items():
+            usage_totals[key] = usage_totals.get(key, 0) + value
+
     with open(out_path, "w") as f:
         json.dump({
             "timestamp": timestamp,
-            "total": len(cases),
+            "runner": runner,
+            "results_file": results_path,
+            "total": len(results),
             "bad_cases": len(bad_cases),
-            "avg_score": round(sum(r["overall_score"] for r in results) / len(results), 1),
+            "avg_score": round(avg, 1),
+            "usage": usage_totals,
+            "model_time": round(sum(r["model_time"] for r in results), 3),
+            "tool_time": round(sum(r["tool_time"] for r in results), 3),
+            "wall_time": round(sum(r["wall_time"] for r in results), 3),
+            "search_cache": SEARCH_CACHE.stats(),
+            "cassette": get_cassette().stats() if get_cassette() else None,
+            "stats": stats,
             "results": results,
         }, f, indent=2)
 
-    avg = sum(r["overall_score"] for r in results) / len(results)
     print(f"{'-'*40}")
-    print(f"avg: {avg:.1f}/100 | bad cases: {len(bad_cases)}/{len(cases)}")
+    if stats["runs"] > stats["cases"]:
+        print_summary(stats)
+    print(f"avg: {avg:.1f}/100 | bad cases: {len(bad_cases)}/{len(results)}")
+    print(f"search cache hit rate: {SEARCH_CACHE.stats()['hit_rate']:.0%}")
+    if get_cassette():
+        stats = get_cassette().stats()
+        print(f"cassette ({stats['mode']}): {stats['hits']} replayed, {stats['recorded']} recorded")
+    if results_path:
+        print(f"results: {results_path}")
     print(f"saved: {out_path}\n")
+    return out_path
 
-    return results
+
+def select_cases(test_ids: list = None, shard: tuple = None, tags: list = None, modes: list = None, cases_dir: str = None) -> list:
+    """
+    The cases to run: the matching ids from the case index, then this
+    shard's slice of them, then only those read from disk. Cases go to
+    shards by a hash of their id, so adding a case doesn't move the others
+    to different shards. Raises ValueError if a selected case is invalid.
+    """
+    index = get_index(cases_dir)
+    ids = index.select(test_ids, tags, modes)
+    if shard:
+        index_no, count = shard
+        ids = [case_id for case_id in ids if _shard_of(case_id, count) == index_no]
+    problems = index.validate(ids)
+    if problems:
+        raise ValueError("invalid cases (python -m eval.cases --validate):\n" + "\n".join(problems))
+    return list(index.load(ids))
+
+
+def expand_trials(cases: list, trials: int) -> list:
+    """Each case repeated trials times, as "<id>#1".."<id>#N" with the original id in case_id."""
+    if trials <= 1:
+        return cases
+    return [
+        {**tc, "id": f"{tc['id']}#{n}", "case_id": tc["id"], "trial": n}
+        for tc in cases
+        for n in range(1, trials + 1)
+    ]
+
+
+def _shard_of(test_id: str, count: int) -> int:
+    # sha1, not crc32: crc32's low bits barely change between ids like code_01 / code_02
+    return int(hashlib.sha1(test_id.encode()).hexdigest(), 16) % count + 1
+
+
+def parse_shard(value: str) -> tuple:
+    """ "2/4" -> (2, 4). """
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/n, e.g. 1/4 - got {value!r}")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"shard {index}/{count}: i has to be between 1 and n")
+    return index, count
+
+
+def _new_results_path(timestamp: str, shard: tuple = None) -> str:
+    # never an existing file - that would quietly resume someone else's run
+    base = f"eval/results/run_{timestamp}" + (f"_shard{shard[0]}of{shard[1]}" if shard else "")
+    path = f"{base}.jsonl"
+    n = 1
+    while os.path.exists(path):
+        n += 1
+        path = f"{base}_{n}.jsonl"
+    return path
+
+
+def _run_case(tc: dict, client=None) -> dict:
+    """One full agent run for a test case. Errors become an ERROR result rather than stopping the eval."""
+    try:
+        agent = AgentForge(mode=tc["mode"], priority="batch", client=client or _worker_client)
+        return agent.run(tc["task"], verbose=False)
+    except Exception as e:
+        return {
+            "result": f"ERROR: {str(e)}",
+            "steps": [],
+            "tool_calls": 0,
+            "total_steps": 0,
+        }
+
+
+# set in each worker process by _init_worker
+_worker_client = None
+
+
+def _init_worker(offline: bool, cassette: tuple = None):
+    global _worker_client
+    if offline:
+        _worker_client = FakeClient()
+        set_search_backend(StubBackend())
+    if cassette:
+        # a fresh one per process, not the parent's copy with its open file
+        set_cassette(Cassette(*cassette))
+        if _worker_client is not None:
+            _worker_client = get_cassette().client(lambda fake=_worker_client: fake)
+
+
+def _score_case(tc: dict, result: dict) -> dict:
+    score = score_run(tc, result)
+    score["case_id"] = tc.get("case_id", tc["id"])
+    score["trial"] = tc.get("trial", 1)
+    score["raw_result"] = result["result"][:500]
+    score["tool_calls"] = result.get("tool_calls", 0)
+    # cost/latency breakdown - is the run model-bound or tool-bound?
+    score["usage"] = result.get("usage", {})
+    score["model_time"] = result.get("model_time", 0.0)
+    score["tool_time"] = result.get("tool_time", 0.0)
+    score["wall_time"] = result.get("wall_time", 0.0)
+    return score
+
+
+def _print_score(i: int, total: int, tc: dict, score: dict):
+    print(f"[{i}/{total}] {tc['description']}")
+    print(f"  task: {tc['task'][:80]}...")
+
+    status = "pass" if not score["is_bad_case"] else "FAIL"
+    print(f"  [{status}] {score['overall_score']}/100 "
+          f"(tools:{score['tool_score']} keywords:{score['keyword_score']} "
+          f"efficiency:{score['efficiency_score']})")
+    print(f"  time: {score['wall_time']:.1f}s (model {score['model_time']:.1f}s, "
+          f"tools {score['tool_time']:.1f}s) | tokens: "
+          f"{score['usage'].get('input_tokens', 0)} in, {score['usage'].get('output_tokens', 0)} out")
+
+    for issue in score["issues"]:
+        print(f"  > {issue}")
+    print()
 
 
 if __name__ == "__main__":
-    run_eval(test_ids=["search_01", "code_01"])
+    parser = argparse.ArgumentParser(description="run the agent eval")
+    parser.add_argument("--ids", help="comma-separated test ids")
+    parser.add_argument("--tag", action="append", help="only cases with this tag (repeatable, !tag excludes)")
+    parser.add_argument("--mode", action="append", help="only cases in this mode (repeatable)")
+    parser.add_argument("--all", action="store_true", help="run every test case (default: the ones tagged smoke)")
+    parser.add_argument("--cases", help="directory of case files (default eval/cases/)")
+    parser.add_argument("--runner", choices=["serial", "concurrent", "processes", "batch"], default="serial")
+    parser.add_argument("--workers", type=int, default=4, help="cases at once, for --runner concurrent/processes")
+    parser.add_argument("--trials", type=int, default=1, help="runs per case, for percentiles (see eval/stats.py)")
+    parser.add_argument("--shard", type=parse_shard, help="run slice i of n of the suite, e.g. 2/4")
+    parser.add_argument("--results", help="JSONL file to append results to; reuse one to resume that run")
+    parser.add_argument("--merge", nargs="+", metavar="JSONL", help="just summarize these result files (e.g. every shard)")
+    parser.add_argument("--offline", action="store_true", help="fake model + stub search, no network")
+    parser.add_argument("--cassette", help="record/replay model + tool calls to this file (see agent/cassette.py)")
+    parser.add_argument("--cassette-mode", choices=CASSETTE_MODES, default="auto")
+    args = parser.parse_args()
+
+    if args.merge:
+        summarize(list(load_results(args.merge).values()), runner="merged")
+        raise SystemExit
+
+    client = None
+    if args.cassette:
+        cassette = Cassette(args.cassette, args.cassette_mode)
+        set_cassette(cassette)
+        if args.offline and args.runner != "processes":
+            client = cassette.client(lambda: FakeClient())
+
+    ids = args.ids.split(",") if args.ids else None
+    tags = args.tag
+    if not (args.all or ids or tags or args.mode):
+        tags = ["smoke"]
+    run_eval(
+        test_ids=ids,
+        tags=tags,
+        modes=args.mode,
+        cases_dir=args.cases,
+        runner=args.runner,
+        workers=args.workers,
+        client=client,
+        offline=args.offline,
+        shard=args.shard,
+        results_path=args.results,
+        trials=args.trials,
+    )